@@ -1,10 +1,19 @@
 import streamlit as st
 from backend.toy_record_mgr import Manager as ToyRecordManager
+from backend.payout import empty_result, last_payout_rate
+from backend.rolling import WINDOW_OPTIONS
 import logging
 import pandas as pd
+from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
+N_DAYS_TO_SHOW = 30
+
+
+def records_since():
+    """The dashboard shows at most the last N_DAYS_TO_SHOW days, plus one reading as the baseline"""
+    return (datetime.now() - timedelta(days=N_DAYS_TO_SHOW + 1)).strftime("%Y-%m-%d")
 
 
 def app():
@@ -39,26 +48,26 @@ def app():
 
     toy_record_manager = ToyRecordManager(env)
 
-    records = toy_record_manager.get_all_income_records()
-    machines = toy_record_manager.get_all_machines_obj()
-    all_analyze_results = []
+    # the reads are independent, so they run concurrently
+    records, machines, all_payout_rates, cube, rolling_metrics = toy_record_manager.load_dashboard_data(since=records_since())
     today_results = []
-    last_3_days_results = []
+    window_results = []
+    with col4:
+        n_days = st.selectbox("Window (days)", WINDOW_OPTIONS, index=WINDOW_OPTIONS.index(3))
     for machine in machines:
-        analyze_result, all_time_payout_rate, last_3_days_payout_rate = toy_record_manager.calculate_machine_payout_rate(machine.id)
-        all_analyze_results.append(analyze_result)
-        today_payout_rate = analyze_result['daily_payout_rate'].iloc[-1]
+        analyze_result, all_time_payout_rate, _ = all_payout_rates.get(machine.id, empty_result())
+        today_payout_rate = last_payout_rate(analyze_result)
         today_results.append((machine.name, today_payout_rate))
-        last_3_days_results.append((machine.name, last_3_days_payout_rate))
+        _, _, window_payout_rate = rolling_metrics.machine_window(machine.id, n_days)
+        window_results.append((machine.name, window_payout_rate))
     today_df = pd.DataFrame(today_results, columns=['machine', 'payout_rate']).sort_values(by='payout_rate', ascending=False)
     today_df['payout_rate'] = today_df['payout_rate'].round(decimals=2)
-    last_3_days_df = pd.DataFrame(last_3_days_results, columns=['machine', 'payout_rate']).sort_values(by='payout_rate', ascending=False)
-    last_3_days_payout_rate = analyze_result['daily_payout_rate'].iloc[-3:].mean()
-    last_3_days_df['payout_rate'] = last_3_days_df['payout_rate'].round(decimals=2)
+    window_df = pd.DataFrame(window_results, columns=['machine', 'payout_rate']).sort_values(by='payout_rate', ascending=False)
+    window_df['payout_rate'] = window_df['payout_rate'].round(decimals=2)
 
-    _, df = toy_record_manager.plot_overall_analyze_result(all_analyze_results)
-    today_payout_rate = df['daily_payout_rate'].iloc[-1]
-    last_3_days_payout_rate = df['daily_payout_rate'].iloc[-3:].mean()
+    df = cube.fleet_daily(N_DAYS_TO_SHOW)
+    today_payout_rate = df['daily_payout_rate'].iloc[-1] if not df.empty else 0.0
+    _, _, window_payout_rate = rolling_metrics.fleet_window(n_days)
 
 
     col1, col2, col3 = st.columns([1, 1, 1])
@@ -101,9 +110,9 @@ def app():
             }))
     with col3:
         with st.container(border=True):
-            st.markdown(f"### Payout Rate - Last 3 Days: {last_3_days_payout_rate:.2f}")
+            st.markdown(f"### Payout Rate - Last {n_days} Days: {window_payout_rate:.2f}")
             st.markdown("#### Hardest 5")
-            hardest_5 = last_3_days_df.head(5).reset_index(drop=True).T
+            hardest_5 = window_df.head(5).reset_index(drop=True).T
             st.dataframe(hardest_5.astype({
                 0: 'string',
                 1: 'string',
@@ -112,7 +121,7 @@ def app():
                 4: 'string'
             }))
             st.markdown("#### Easiest 5")
-            easiest_5 = last_3_days_df.tail(5).sort_values(by='payout_rate', ascending=True).reset_index(drop=True).T
+            easiest_5 = window_df.tail(5).sort_values(by='payout_rate', ascending=True).reset_index(drop=True).T
             st.dataframe(easiest_5.astype({
                 0: 'string',
                 1: 'string',
@@ -4,6 +4,8 @@ from dataclasses import dataclass
 import numpy as np
 
 from backend.toy_record_mgr import Manager, Record
+from backend.rolling import WINDOW_OPTIONS
+from backend.chart_cache import cached_chart
 import matplotlib.pyplot as plt
 
 def show_list(data, all_machines):
@@ -19,13 +21,17 @@ def show_bar_chart(data, all_machines, title):
     sorted_idx = np.argsort(data)[::-1]
     labels = [all_machines[idx].name for idx in sorted_idx]
     values = [data[idx] for idx in sorted_idx]
-    fig, ax = plt.subplots()
-    ax.barh(labels, values)
-    ax.set_xlabel('Payout Rate')
-    ax.set_ylabel('Machine')
-    ax.set_title(title)
-    ax.grid(True)
-    st.pyplot(fig)
+
+    def draw():
+        fig, ax = plt.subplots()
+        ax.barh(labels, values)
+        ax.set_xlabel('Payout Rate')
+        ax.set_ylabel('Machine')
+        ax.set_title(title)
+        ax.grid(True)
+        return fig
+
+    st.image(cached_chart(draw, 'leaderboard_bar', title, labels, [float(value) for value in values]))
 
     data_df = pd.DataFrame({'Machine': labels, 'Payout Rate': values}, index=range(len(labels)))
     return data_df
@@ -44,7 +50,7 @@ def app():
 
     last_day_payout_rate = [result['last_day_payout_rate'] for result in all_results]
     all_time_payout_rate = [result['all_time_payout_rate'] for result in all_results]
-    last_3_days_payout_rate = [result['last_3_days_payout_rate'] for result in all_results]
+    rolling_metrics = manager.get_rolling_metrics()
 
     col1, col2 = st.columns(2)
     with col1:
@@ -53,7 +59,9 @@ def app():
             st.write(data_df)
 
     with col2:
-        data_df = show_bar_chart(last_3_days_payout_rate, all_machines, "Last 3 Days Payout Rate")
+        n_days = st.selectbox("Window (days)", WINDOW_OPTIONS, index=WINDOW_OPTIONS.index(3))
+        window_payout_rate = [rolling_metrics.machine_window(machine.id, n_days)[2] for machine in all_machines]
+        data_df = show_bar_chart(window_payout_rate, all_machines, f"Last {n_days} Days Payout Rate")
         with st.expander("Detail", expanded=False):
             st.write(data_df)
 
@@ -4,6 +4,7 @@ from dataclasses import dataclass
 import logging
 
 from backend.toy_record_mgr import Manager, Machine
+from db.cache import get_read_cache
 from io import BytesIO
 
 logger = logging.getLogger(__name__)
@@ -11,8 +12,8 @@ logger = logging.getLogger(__name__)
 if 'selected_machine_id_for_edit' not in st.session_state:
     st.session_state['selected_machine_id_for_edit'] = None
 
-def delete_machine(machine_id, manager: Manager):
-    manager.delete_machine(machine_id)
+def delete_machine(machine_id, manager: Manager, machine=None):
+    manager.delete_machine(machine_id, machine)
     st.success("Machine deleted successfully")
 
 def edit_machine(machine_id, manager: Manager):
@@ -27,6 +28,7 @@ def app():
     with col2:
         if st.button("Refresh"):
             st.cache_data.clear()
+            get_read_cache(st.secrets['ENV']['ENV']).clear()
             st.rerun()
     st.markdown("---")
 
@@ -34,6 +36,8 @@ def app():
     env = st.secrets['ENV']['ENV']
     manager = Manager(env)
     machines = manager.get_all_machines()
+    images = manager.get_images_by_machine_ids([machine['id'] for machine in machines])
+    record_counts = manager.count_records_by_machine_ids([machine['id'] for machine in machines])
     num_columns = 4
     columns = st.columns(num_columns)
 
@@ -42,7 +46,7 @@ def app():
         location = machine['location']
         status = machine['status']
         notes = machine['notes']
-        image = manager.get_image_by_machine_id(machine['id'])
+        image = images[machine['id']]
         if 'doc_id' in machine:
             del machine['doc_id']
         machine_obj = Machine(**machine)
@@ -66,11 +70,12 @@ def app():
                 st.markdown(f"**Params:** {machine_obj.get_params()}")
             if status is not None and status != "":
                 st.markdown(f"**Status:** {status}")
+            st.markdown(f"**Records:** {record_counts[machine['id']]}")
             if notes is not None and notes != "":
                 st.markdown(f"**Notes:** {notes}")
             col1, col2, _ = st.columns([1, 1, 2])
             with col1:
-                st.button("Delete", key=f"delete_{machine['id']}", on_click=delete_machine, args=(machine['id'], manager))
+                st.button("Delete", key=f"delete_{machine['id']}", on_click=delete_machine, args=(machine['id'], manager, machine))
             with col2:
                 if st.button("Edit", key=f"edit_{machine['id']}", on_click=edit_machine, args=(machine['id'], manager)):
                     st.rerun()
@@ -1,23 +1,37 @@
 import streamlit as st
 from backend.order_mgr import OrderManager
 from models.orders import PlushieType
+from backend.pagination import get_paginator, reset_paginator
 import pandas as pd
 
-env = st.secrets['ENV']['ENV']
-manager = OrderManager(env)
+ORDERS_PAGE_SIZE = 20
+
+def get_manager():
+    env = st.secrets['ENV']['ENV']
+    return OrderManager(env)
+
+def orders_paginator_key(plushie_type):
+    return f"orders_paginator_{plushie_type}"
+
+def reset_orders_paginators():
+    for plushie_type in PlushieType:
+        reset_paginator(orders_paginator_key(plushie_type.value))
 
 def edit_order(order):
+    reset_orders_paginators()
     st.session_state['selected_order_for_edit'] = order
     st.session_state['page'] = 'edit_order'
 
 def duplicate_order(order):
+    reset_orders_paginators()
     st.session_state['selected_order_for_duplicate'] = order
     st.session_state['page'] = 'add_order'
 
 def delete_order(order):
-    manager.delete_order(order['id'])
+    get_manager().delete_order(order['id'], order)
+    reset_orders_paginators()
 
-def render_order_card(order):
+def render_order_card(order, manager: OrderManager):
     default_image_map = {
         PlushieType.small.value: 'images/small_plushie.png',
         PlushieType.medium.value: 'images/medium_plushie.png',
@@ -64,7 +78,8 @@ def render_order_card(order):
 
 def get_date_amount_df(orders):
     """
-    Get a dataframe showing the date and the amount of orders for each date
+    Get a dataframe showing the date and the amount of orders for each date.
+    Only the given orders are counted, on the order status page those are the pages loaded so far.
     """
     df = pd.DataFrame(orders)
     df['expected_deliver_date'] = pd.to_datetime(df['expected_deliver_date']).dt.strftime('%Y-%m-%d')
@@ -75,7 +90,7 @@ def get_date_amount_df(orders):
 
 def app():
     st.title("Order Status") 
-    all_orders = manager.get_all_orders()
+    manager = get_manager()
     # select types to display
     selected_types = st.multiselect("Select Plushie Types", PlushieType.__members__.values(), default=[PlushieType.small, PlushieType.large])
     if len(selected_types) == 0:
@@ -87,12 +102,23 @@ def app():
     for i, selected_type in enumerate(selected_types):
         with cols[i]:
             st.markdown(f"### {selected_type.value}")
-            selected_orders = [order for order in all_orders if order['plushie_type'] == selected_type.value]
-            if len(selected_orders) == 0:
-                st.warning("No orders found")
-            else:
+            # totals cover every order of the type, not only the loaded pages
+            st.dataframe(manager.get_status_summary(selected_type.value), hide_index=True)
+            paginator = get_paginator(
+                orders_paginator_key(selected_type.value),
+                lambda cursor, plushie_type=selected_type.value: manager.get_orders_page(plushie_type, ORDERS_PAGE_SIZE, cursor),
+            )
+            selected_orders = paginator.items
+            if len(selected_orders) > 0:
+                if not paginator.done:
+                    st.caption(f"Amount by expected delivery date of the {len(selected_orders)} orders loaded so far")
                 st.write(get_date_amount_df(selected_orders))
                 for order in selected_orders:
-                    render_order_card(order)
+                    render_order_card(order, manager)
+            elif paginator.done:
+                st.warning("No orders found")
+            # a page can come back empty before the last one, e.g. when there are only orders without a shipping date
+            if not paginator.done:
+                st.button("Load more", key=f"load_more_{selected_type.value}", on_click=paginator.load_next)
 
 
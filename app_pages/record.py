@@ -5,12 +5,11 @@ import traceback
 import logging
 import pytz
 from datetime import datetime
-import time
 from backend.toy_record_mgr import Manager, Record
 
 logger = logging.getLogger(__name__)
 
-def save_record(machine_id, manager: Manager):
+def build_record(machine_id):
     date = st.session_state[f"date"]
     date_str = date.strftime("%Y-%m-%d")
     coins_in_str = st.session_state[f"coins_in_str_{machine_id}"]
@@ -24,22 +23,26 @@ def save_record(machine_id, manager: Manager):
     param_mode = st.session_state[f"param_mode_{machine_id}"]
     notes = st.session_state[f"notes_{machine_id}"]
     id = f"{date_str}#{machine_id}"
-    if coins_in == 0 or toys_payout == 0:
-        st.error("Coins in and toys payout cannot be 0! Please check your input and try again.")
+    return Record(
+        id=id,
+        date=date_str,
+        machine_id=machine_id,
+        coins_in=coins_in,
+        toys_payout=toys_payout,
+        param_strong_strength=param_strong_strength,
+        param_medium_strength=param_medium_strength,
+        param_weak_strength=param_weak_strength,
+        param_award_interval=param_award_interval,
+        param_mode=param_mode,
+        notes=notes
+    )
+
+
+def save_record(machine_id, manager: Manager):
     try:
-        record = Record(
-            id=id,
-            date=date_str,
-            machine_id=machine_id,
-            coins_in=coins_in,
-            toys_payout=toys_payout,
-            param_strong_strength=param_strong_strength,
-            param_medium_strength=param_medium_strength,
-            param_weak_strength=param_weak_strength,
-            param_award_interval=param_award_interval,
-            param_mode=param_mode,
-            notes=notes
-        )
+        record = build_record(machine_id)
+        if record.coins_in == 0 or record.toys_payout == 0:
+            st.error("Coins in and toys payout cannot be 0! Please check your input and try again.")
         manager.create_record(record)
         st.success("Record saved successfully!")
     except Exception as e:
@@ -48,6 +51,26 @@ def save_record(machine_id, manager: Manager):
         st.error(f"Error saving record: {e}")
 
 
+def save_all_records(machines, manager: Manager):
+    records = []
+    failed = []
+    for machine in machines:
+        try:
+            records.append(build_record(machine['id']))
+        except ValueError as e:
+            failed.append({'machine_id': machine['id'], 'record_id': None, 'saved': False, 'error': str(e)})
+    results = manager.create_records(records) + failed
+    names = {machine['id']: machine['name'] for machine in machines}
+    n_saved = sum(result['saved'] for result in results)
+    if n_saved == len(results):
+        st.success(f"All {n_saved} records saved successfully!")
+    else:
+        st.warning(f"Saved {n_saved} of {len(results)} records")
+        for result in results:
+            if not result['saved']:
+                st.error(f"{names.get(result['machine_id']) or result['machine_id']}: {result['error']}")
+
+
 def app():
     env = st.secrets['ENV']['ENV']
     manager = Manager(env)
@@ -79,6 +102,7 @@ def app():
 
     # show all machines and images
     machines = manager.get_all_machines()
+    images = manager.get_images_by_machine_ids([machine['id'] for machine in machines])
     
 
 
@@ -87,7 +111,7 @@ def app():
         with st.form(key='record_form_'+machine_id, border=False):
             cols = st.columns(5)
             with cols[0]:
-                machine_image = manager.get_image_by_machine_id(machine_id)
+                machine_image = images[machine_id]
                 if machine_image is None:
                     machine_image = 'claw_machine.webp'
                 name = machine['name']
@@ -133,12 +157,7 @@ def app():
     if st.button("Save All"):
         # collect all the data
         with st.spinner("Saving..."):
-            for machine in machines:
-                machine_id = machine['id']
-                save_record(machine_id, manager)
-                time.sleep(1)
-
-        st.success("Record saved successfully!")
+            save_all_records(machines, manager)
     
 
 if __name__ == "__main__":
@@ -2,7 +2,9 @@ import streamlit as st
 import pandas as pd
 from dataclasses import dataclass
 
-from backend.toy_record_mgr import Manager, Record
+from backend.toy_record_mgr import Manager, Record, DETAIL_FIELDS
+from backend.payout import empty_result, last_payout_rate
+from backend.downsample import downsample
 import matplotlib.pyplot as plt
 
 
@@ -15,16 +17,19 @@ def app():
     env = st.secrets['ENV']['ENV']
     manager = Manager(env)
     machines = manager.get_all_machines_obj()
-    all_results = []
-    for machine in machines:
-        analyze_result, all_time_payout_rate, last_3_days_payout_rate = manager.calculate_machine_payout_rate(machine.id)
-        all_results.append((analyze_result, all_time_payout_rate, last_3_days_payout_rate))
-    all_analyze_results = [r[0] for r in all_results]
+    # one records read feeds the analysis and every machine's detail table
+    records = manager.get_all_records_detail_df()
+    all_payout_rates = manager.calculate_all_machines_payout_rates(records=records)
+    records_by_machine_id = manager.split_records_by_machine_id(records)
+    all_results = [all_payout_rates.get(machine.id, empty_result()) for machine in machines]
+    images = manager.get_images_by_machine_ids([machine.id for machine in machines])
     
     st.markdown("#### Overall Analysis")
 
     # plot
-    df1, df2 = manager.plot_overall_analyze_result(all_analyze_results)
+    fleet_daily = manager.get_fleet_cube().fleet_daily(30)
+    df1 = fleet_daily[['daily_coins_in', 'daily_toys_payout', 'date']].copy()
+    df2 = fleet_daily[['daily_payout_rate', 'date']].copy()
 
     cols = st.columns(2)
     with cols[0]:
@@ -33,7 +38,7 @@ def app():
         df1['date'] = pd.to_datetime(df1['date'])
         df1['day_of_week'] = df1['date'].dt.strftime('%a')
         df1['date_with_day'] = df1['date'].dt.strftime('%m-%d') + '_' + df1['day_of_week']
-        df1.plot(x='date_with_day', y=['daily_coins_in', 'daily_toys_payout'], ax=ax, style='-o')
+        downsample(df1, ['daily_coins_in', 'daily_toys_payout']).plot(x='date_with_day', y=['daily_coins_in', 'daily_toys_payout'], ax=ax, style='-o')
         ax.set_title('Coins In & Toys Payout')
         ax.grid(True)
         st.pyplot(fig)
@@ -46,7 +51,7 @@ def app():
         df2['date'] = pd.to_datetime(df2['date'])
         df2['day_of_week'] = df2['date'].dt.strftime('%a')
         df2['date_with_day'] = df2['date'].dt.strftime('%m-%d') + '_' + df2['day_of_week']
-        df2.plot(x='date_with_day', y='daily_payout_rate', ax=ax, style='-o')
+        downsample(df2, ['daily_payout_rate']).plot(x='date_with_day', y='daily_payout_rate', ax=ax, style='-o')
         ax.set_title('Payout Rate')
         ax.set_ylim(0, 15)
         ax.grid(True)
@@ -62,7 +67,7 @@ def app():
         analyze_result, all_time_payout_rate, last_3_days_payout_rate = all_results[i]
         
         with cols[0]:
-            machine_image = manager.get_image_by_machine_id(machine_id)
+            machine_image = images[machine_id]
             name = machine.name
             location = machine.location
             st.image(machine_image, width=150)
@@ -74,15 +79,14 @@ def app():
                 st.markdown(f"**Location:** {location}")
             st.markdown(f"**All Time Payout Rate:** {all_time_payout_rate:.2f}")
             st.markdown(f"**3-Day Payout Rate:** {last_3_days_payout_rate:.2f}") 
-            st.markdown(f"**Last Payout Rate:** {analyze_result['daily_payout_rate'].tolist()[-1]:.2f}") 
+            st.markdown(f"**Last Payout Rate:** {last_payout_rate(analyze_result):.2f}") 
             st.markdown(f"**Machine Params:** {machine.get_params()}")
 
         with cols[1]:
             manager.plot_analyze_result(analyze_result)
         
         with st.expander("Detail Records", expanded=False):
-            df = manager.get_records_by_machine_id(machine_id)
-            st.dataframe(df)
+            st.dataframe(records_by_machine_id.get(machine_id, pd.DataFrame(columns=DETAIL_FIELDS)))
         
         st.markdown("---")
 
@@ -4,6 +4,7 @@ from utils import get_image_by_path, get_image_by_path_no_cache
 
 class Manager:
     def __init__(self, env):
+        self.env = env
         self.blob_db = BlobDB(env)
         self.firestore_db = FirestoreDB(env)
 
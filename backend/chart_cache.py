@@ -0,0 +1,82 @@
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+import pandas as pd
+import streamlit as st
+import matplotlib.pyplot as plt
+
+
+class ChartCache:
+    """LRU cache of rendered chart PNGs, bounded by entry count and total bytes"""
+    def __init__(self, max_entries: int = 512, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        with self.lock:
+            png = self.entries.get(key)
+            if png is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return png
+
+    def put(self, key: str, png: bytes):
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= len(self.entries.pop(key))
+            self.entries[key] = png
+            self.total_bytes += len(png)
+            while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+@st.cache_resource
+def get_chart_cache():
+    return ChartCache()
+
+
+def chart_key(*parts) -> str:
+    """Hash of the data behind a chart and its options"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (pd.DataFrame, pd.Series)):
+            digest.update(repr(list(part.columns) if isinstance(part, pd.DataFrame) else part.name).encode())
+            digest.update(pd.util.hash_pandas_object(part, index=True).values.tobytes())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b'|')
+    return digest.hexdigest()
+
+
+def render_png(fig) -> bytes:
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=200, bbox_inches='tight')
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def cached_chart(draw: Callable[[], object], *key_parts) -> bytes:
+    """PNG of the figure returned by draw(), rendered only when no chart with the same key is cached"""
+    cache = get_chart_cache()
+    key = chart_key(*key_parts)
+    png = cache.get(key)
+    if png is None:
+        png = render_png(draw())
+        cache.put(key, png)
+    return png
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+from typing import List
+
+# default point budget per chart
+MAX_PLOT_POINTS = 60
+
+
+def lttb_indices(y, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of n_out points that keep the visual shape of y.
+    Points are taken as evenly spaced, which matches our one-reading-per-day series.
+    The first and last points are always kept.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=float)
+    every = (n - 2) / (n_out - 2)
+    selected = [0]
+    a = 0
+    for i in range(n_out - 2):
+        # average of the next bucket is the third corner of the triangle
+        next_start = int(np.floor((i + 1) * every)) + 1
+        next_end = min(int(np.floor((i + 2) * every)) + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        start = int(np.floor(i * every)) + 1
+        end = int(np.floor((i + 1) * every)) + 1
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected.append(a)
+    selected.append(n - 1)
+    return np.asarray(selected)
+
+
+def downsample(df: pd.DataFrame, y_columns: List[str], max_points: int = MAX_PLOT_POINTS) -> pd.DataFrame:
+    """
+    Reduce df to roughly max_points rows for plotting. The budget is split over y_columns and
+    the rows picked for any column are kept, so every series keeps its own peaks.
+    """
+    if max_points is None or len(df) <= max_points:
+        return df
+    budget = max(max_points // len(y_columns), 3)
+    keep = np.unique(np.concatenate([lttb_indices(df[column].values, budget) for column in y_columns]))
+    return df.iloc[keep]
@@ -0,0 +1,198 @@
+import io
+import numpy as np
+import pandas as pd
+from typing import Dict
+
+from backend.payout import compute_daily_deltas, payout_rate
+
+
+def to_epoch_days(dates) -> np.ndarray:
+    return pd.to_datetime(pd.Series(dates)).values.astype('datetime64[D]').astype(np.int64)
+
+
+def to_epoch_seconds(dates) -> np.ndarray:
+    return pd.to_datetime(pd.Series(dates)).values.astype('datetime64[s]').astype(np.int64)
+
+
+class FleetCube:
+    """
+    Dense machines x days arrays of daily coins_in / toys_payout deltas.
+    Row i belongs to machine_ids[i], column j to epoch day start_day + j.
+    The last cumulative reading of every machine is kept so newer readings can be appended incrementally.
+    updated_mark is the newest record updated_at (epoch seconds) the cube has seen, None if it was never tracked.
+    """
+    def __init__(self, machine_ids=None, start_day=0, coins_in=None, toys_payout=None,
+                 last_time=None, last_coins_in=None, last_toys_payout=None, updated_mark=None):
+        self.machine_ids = np.asarray(machine_ids if machine_ids is not None else [], dtype=str)
+        self.start_day = int(start_day)
+        n_machines = len(self.machine_ids)
+        self.coins_in = coins_in if coins_in is not None else np.zeros((n_machines, 0), dtype=np.int32)
+        self.toys_payout = toys_payout if toys_payout is not None else np.zeros((n_machines, 0), dtype=np.int32)
+        self.last_time = last_time if last_time is not None else np.full(n_machines, -1, dtype=np.int64)
+        self.last_coins_in = last_coins_in if last_coins_in is not None else np.zeros(n_machines, dtype=np.int64)
+        self.last_toys_payout = last_toys_payout if last_toys_payout is not None else np.zeros(n_machines, dtype=np.int64)
+        self.updated_mark = updated_mark
+        self._index = {machine_id: i for i, machine_id in enumerate(self.machine_ids)}
+
+    @classmethod
+    def from_records(cls, records: pd.DataFrame) -> 'FleetCube':
+        cube = cls()
+        cube.append(records)
+        return cube
+
+    def copy(self) -> 'FleetCube':
+        return FleetCube(self.machine_ids.copy(), self.start_day, self.coins_in.copy(), self.toys_payout.copy(),
+                         self.last_time.copy(), self.last_coins_in.copy(), self.last_toys_payout.copy(), self.updated_mark)
+
+    @property
+    def n_days(self) -> int:
+        return self.coins_in.shape[1]
+
+    @property
+    def dates(self) -> np.ndarray:
+        return (np.arange(self.n_days) + self.start_day).astype('datetime64[D]')
+
+    def _add_machines(self, machine_ids):
+        new_ids = [machine_id for machine_id in machine_ids if machine_id not in self._index]
+        if not new_ids:
+            return
+        n_new = len(new_ids)
+        self.machine_ids = np.concatenate([self.machine_ids, np.asarray(new_ids, dtype=str)])
+        self.coins_in = np.vstack([self.coins_in, np.zeros((n_new, self.n_days), dtype=np.int32)])
+        self.toys_payout = np.vstack([self.toys_payout, np.zeros((n_new, self.n_days), dtype=np.int32)])
+        self.last_time = np.concatenate([self.last_time, np.full(n_new, -1, dtype=np.int64)])
+        self.last_coins_in = np.concatenate([self.last_coins_in, np.zeros(n_new, dtype=np.int64)])
+        self.last_toys_payout = np.concatenate([self.last_toys_payout, np.zeros(n_new, dtype=np.int64)])
+        self._index = {machine_id: i for i, machine_id in enumerate(self.machine_ids)}
+
+    def _cover_days(self, first_day, last_day):
+        if self.n_days == 0:
+            self.start_day = first_day
+        before = max(self.start_day - first_day, 0)
+        after = max(last_day - (self.start_day + self.n_days - 1), 0)
+        if before == 0 and after == 0:
+            return
+        padding = ((0, 0), (before, after))
+        self.coins_in = np.pad(self.coins_in, padding)
+        self.toys_payout = np.pad(self.toys_payout, padding)
+        self.start_day -= before
+
+    def append(self, records: pd.DataFrame) -> int:
+        """
+        Add readings newer than each machine's last known reading. Older readings are ignored, see rewrite().
+        Several readings on one day add up to that day's delta. Returns the number of deltas added.
+        """
+        if records.empty:
+            return 0
+        readings = records[['machine_id', 'date', 'coins_in', 'toys_payout']].copy()
+        readings['time'] = to_epoch_seconds(readings['date'])
+        self._add_machines(readings['machine_id'].unique())
+        rows = np.array([self._index[machine_id] for machine_id in readings['machine_id']], dtype=np.int64)
+        readings = readings[readings['time'].values > self.last_time[rows]]
+        if readings.empty:
+            return 0
+
+        # previous cumulative reading of each machine acts as the baseline for its first new reading
+        known = np.flatnonzero(self.last_time >= 0)
+        baseline = pd.DataFrame({
+            'machine_id': self.machine_ids[known],
+            'date': self.last_time[known].astype('datetime64[s]'),
+            'coins_in': self.last_coins_in[known],
+            'toys_payout': self.last_toys_payout[known],
+        })
+        baseline = baseline[baseline['machine_id'].isin(readings['machine_id'].unique())]
+        deltas = compute_daily_deltas(pd.concat([baseline, readings.drop(columns='time')], ignore_index=True))
+
+        if not deltas.empty:
+            days = to_epoch_days(deltas['date'])
+            self._cover_days(int(days.min()), int(days.max()))
+            rows = np.array([self._index[machine_id] for machine_id in deltas['machine_id']], dtype=np.int64)
+            cols = days - self.start_day
+            np.add.at(self.coins_in, (rows, cols), deltas['daily_coins_in'].values.astype(self.coins_in.dtype))
+            np.add.at(self.toys_payout, (rows, cols), deltas['daily_toys_payout'].values.astype(self.toys_payout.dtype))
+
+        latest = readings.sort_values(by='time', kind='mergesort').groupby('machine_id').last()
+        rows = np.array([self._index[machine_id] for machine_id in latest.index], dtype=np.int64)
+        self.last_time[rows] = latest['time'].values
+        self.last_coins_in[rows] = latest['coins_in'].values
+        self.last_toys_payout[rows] = latest['toys_payout'].values
+        return len(deltas)
+
+    def rewrite(self, from_days: Dict[str, int], records: pd.DataFrame, baselines: pd.DataFrame) -> bool:
+        """
+        Recompute machines from an epoch day on, for corrected readings and readings inserted before newer ones.
+        records holds every reading of those machines from their from day on, baselines each machine's last
+        reading before it, if it has one. Returns whether the cube changed.
+        """
+        n_machines, start_day, n_days = len(self.machine_ids), self.start_day, self.n_days
+        self._add_machines(list(from_days))
+        rows = np.array([self._index[machine_id] for machine_id in from_days], dtype=np.int64)
+        arrays = [self.coins_in, self.toys_payout, self.last_time, self.last_coins_in, self.last_toys_payout]
+        before = [array[rows].copy() for array in arrays]
+
+        for row, from_day in zip(rows, from_days.values()):
+            first = min(max(from_day - self.start_day, 0), self.n_days)
+            self.coins_in[row, first:] = 0
+            self.toys_payout[row, first:] = 0
+        self.last_time[rows] = -1
+        self.last_coins_in[rows] = 0
+        self.last_toys_payout[rows] = 0
+        # a single reading per machine adds no deltas, it only becomes the last known reading
+        self.append(baselines)
+        self.append(records)
+
+        if (len(self.machine_ids), self.start_day, self.n_days) != (n_machines, start_day, n_days):
+            return True
+        arrays = [self.coins_in, self.toys_payout, self.last_time, self.last_coins_in, self.last_toys_payout]
+        return any(not np.array_equal(array[rows], previous) for array, previous in zip(arrays, before))
+
+    def window(self, n_days: int = None):
+        """coins_in / toys_payout slices of the trailing n_days (all days when None)"""
+        if n_days is None:
+            return self.coins_in, self.toys_payout
+        return self.coins_in[:, -n_days:], self.toys_payout[:, -n_days:]
+
+    def fleet_daily(self, n_days: int = None) -> pd.DataFrame:
+        """Fleet-wide daily_coins_in / daily_toys_payout / daily_payout_rate per date of the trailing n_days"""
+        coins_in, toys_payout = self.window(n_days)
+        dates = self.dates[-coins_in.shape[1]:] if coins_in.shape[1] else self.dates[:0]
+        daily = pd.DataFrame({
+            'daily_coins_in': coins_in.sum(axis=0, dtype=np.int64),
+            'daily_toys_payout': toys_payout.sum(axis=0, dtype=np.int64),
+            'date': pd.to_datetime(dates),
+        })
+        daily['daily_payout_rate'] = payout_rate(daily['daily_coins_in'], daily['daily_toys_payout'])
+        return daily
+
+    def to_npz_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            machine_ids=self.machine_ids,
+            start_day=np.int64(self.start_day),
+            coins_in=self.coins_in,
+            toys_payout=self.toys_payout,
+            last_time=self.last_time,
+            last_coins_in=self.last_coins_in,
+            last_toys_payout=self.last_toys_payout,
+            updated_mark=np.float64(np.nan if self.updated_mark is None else self.updated_mark),
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_npz_bytes(cls, data: bytes) -> 'FleetCube':
+        """Load a cube saved by to_npz_bytes; cubes saved before updated_at was tracked have no updated_mark"""
+        with np.load(io.BytesIO(data)) as arrays:
+            if 'updated_mark' not in arrays.files:
+                return cls(updated_mark=None)
+            updated_mark = float(arrays['updated_mark'])
+            return cls(
+                machine_ids=arrays['machine_ids'],
+                start_day=int(arrays['start_day']),
+                coins_in=arrays['coins_in'],
+                toys_payout=arrays['toys_payout'],
+                last_time=arrays['last_time'],
+                last_coins_in=arrays['last_coins_in'],
+                last_toys_payout=arrays['last_toys_payout'],
+                updated_mark=None if np.isnan(updated_mark) else updated_mark,
+            )
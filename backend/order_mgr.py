@@ -2,6 +2,8 @@ import logging
 from datetime import datetime
 import uuid
 from backend.base_manager import Manager as BaseManager
+from models.orders import OrderStatus
+import pandas as pd
 
 class OrderManager(BaseManager):
     def __init__(self, env):
@@ -23,19 +25,42 @@ class OrderManager(BaseManager):
     def update_order(self, order_id, updates):
         self.firestore_db.update_document('orders', order_id, updates)
 
-    def delete_order(self, order_id):
-        order = self.get_order(order_id)
+    def delete_order(self, order_id, order=None):
+        if order is None:
+            order = self.get_order(order_id)
         if order['image_path']:
             self.blob_db.delete_file(order['image_path'])
         self.firestore_db.delete_document('orders', order_id)
 
-    def get_all_orders(self):
-        all_orders = self.firestore_db.get_collection('orders')
-        # Sort by delivery date, handling None values and timezone
-        all_orders.sort(key=lambda x: (x['shipping_date'].replace(tzinfo=None) 
-                                     if x['shipping_date'] 
-                                     else datetime.max))
-        return all_orders
+    def get_orders_page(self, plushie_type, page_size=20, cursor=None):
+        """
+        One page of a plushie type's orders sorted by shipping date, as (orders, cursor).
+        Orders with a shipping date come first, then the ones without.
+        """
+        phase, start_after = cursor if cursor is not None else ('dated', None)
+        type_filter = ('plushie_type', '==', plushie_type)
+        if phase == 'dated':
+            orders, next_cursor = self.firestore_db.get_page(
+                'orders', page_size, order_by='shipping_date', start_after=start_after,
+                filters=[type_filter, ('shipping_date', '!=', None)])
+            if next_cursor is None:
+                return orders, ('undated', None)
+            return orders, ('dated', next_cursor)
+        orders, next_cursor = self.firestore_db.get_page(
+            'orders', page_size, order_by='created_date', start_after=start_after,
+            filters=[type_filter, ('shipping_date', '==', None)])
+        return orders, ('undated', next_cursor) if next_cursor is not None else None
+
+    def get_status_summary(self, plushie_type):
+        """Number of orders and plushies ordered per status for a plushie type, one aggregation read per status"""
+        rows = []
+        for status in OrderStatus:
+            totals = self.firestore_db.aggregate('orders', [
+                ('count', None, 'orders'),
+                ('sum', 'amount', 'amount'),
+            ], filters=[('plushie_type', '==', plushie_type), ('status', '==', status.value)])
+            rows.append({'status': status.value, 'orders': int(totals['orders']), 'amount': int(totals['amount'] or 0)})
+        return pd.DataFrame(rows, columns=['status', 'orders', 'amount'])
 
     def create_inventory(self, inventory, image=None):
         if image is not None:
@@ -53,8 +78,9 @@ class OrderManager(BaseManager):
     def update_inventory(self, inventory_id, updates):
         self.firestore_db.update_document('inventory', inventory_id, updates)
 
-    def delete_inventory(self, inventory_id):
-        inventory = self.get_inventory(inventory_id)
+    def delete_inventory(self, inventory_id, inventory=None):
+        if inventory is None:
+            inventory = self.get_inventory(inventory_id)
         if inventory['image_path']:
             self.blob_db.delete_file(inventory['image_path'])
         self.firestore_db.delete_document('inventory', inventory_id)
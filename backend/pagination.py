@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Tuple
+
+import streamlit as st
+
+# shared by every session, page fetches are short I/O-bound calls
+prefetch_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='page-prefetch')
+
+
+class Paginator:
+    """
+    Pages of a cursor-paginated read, loaded on demand.
+    fetch_page(cursor) returns (items, next_cursor), next_cursor None on the last page.
+    The page after the last loaded one is always being fetched in the background.
+    """
+    def __init__(self, fetch_page: Callable[[Any], Tuple[List[Any], Any]]):
+        self.fetch_page = fetch_page
+        self.items = []
+        self.cursor = None
+        self.done = False
+        self.next_page = None
+
+    def load_next(self):
+        if self.done:
+            return
+        if self.next_page is not None:
+            items, cursor = self.next_page.result()
+        else:
+            items, cursor = self.fetch_page(self.cursor)
+        self.items.extend(items)
+        self.cursor = cursor
+        self.done = cursor is None
+        self.next_page = None if self.done else prefetch_executor.submit(self.fetch_page, self.cursor)
+
+
+def get_paginator(key: str, fetch_page: Callable[[Any], Tuple[List[Any], Any]]) -> Paginator:
+    """The session's paginator for key, created with its first page loaded"""
+    if key not in st.session_state:
+        paginator = Paginator(fetch_page)
+        paginator.load_next()
+        st.session_state[key] = paginator
+    return st.session_state[key]
+
+
+def reset_paginator(key: str):
+    st.session_state.pop(key, None)
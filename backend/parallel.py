@@ -0,0 +1,46 @@
+import os
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+# below this many records the process start-up cost outweighs the gain
+PARALLEL_MIN_RECORDS = 20000
+
+
+def shard_by_machine(records: pd.DataFrame, n_shards: int) -> List[pd.DataFrame]:
+    """Split a records frame into at most n_shards frames of whole machines, balanced by row count"""
+    sizes = records['machine_id'].value_counts()
+    loads = [0] * n_shards
+    assignment = {}
+    for machine_id, size in sizes.items():
+        shard = loads.index(min(loads))
+        assignment[machine_id] = shard
+        loads[shard] += size
+    shard_ids = records['machine_id'].map(assignment)
+    return [shard for _, shard in records.groupby(shard_ids, sort=False)]
+
+
+def run_sharded(func: Callable[..., Dict], records: pd.DataFrame, *args,
+                max_workers: int = None, min_records: int = PARALLEL_MIN_RECORDS) -> Dict:
+    """
+    Run func(records_shard, *args) for every machine shard in a process pool and merge the dict results.
+    func must be a module-level function returning a dict keyed by machine id.
+    Small inputs run serially in the calling process.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    if len(records) < min_records or max_workers < 2:
+        return func(records, *args)
+    shards = shard_by_machine(records, max_workers)
+    logger.info(f"running {func.__name__} on {len(records)} records in {len(shards)} processes")
+    # spawn, not fork: the parent holds gRPC channels that must not be forked
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(func, shard, *args) for shard in shards]
+        results = {}
+        for future in futures:
+            results.update(future.result())
+    return results
+
@@ -0,0 +1,79 @@
+import pandas as pd
+from typing import Dict, Tuple
+
+RESULT_COLUMNS = ['daily_payout_rate', 'daily_coins_in', 'daily_toys_payout', 'date']
+
+
+def payout_rate(coins_in, toys_payout):
+    """Coins per toy, 0 when either side is 0. Works on scalars and Series."""
+    if isinstance(coins_in, pd.Series):
+        valid = (coins_in != 0) & (toys_payout != 0)
+        rate = coins_in.where(valid, 0) / toys_payout.where(valid, 1)
+        return rate.where(valid, 0.0).astype(float)
+    if coins_in == 0 or toys_payout == 0:
+        return 0.0
+    return coins_in / toys_payout
+
+
+def compute_daily_deltas(records: pd.DataFrame) -> pd.DataFrame:
+    """
+    Turn cumulative meter readings into per-machine daily deltas in one grouped pass.
+    A reading lower than the previous one is a meter reset, so the previous reading counts as 0.
+    The first reading of each machine is only a baseline and is dropped.
+    """
+    df = records[['machine_id', 'date', 'coins_in', 'toys_payout']].copy()
+    df['date'] = pd.to_datetime(df['date'])
+    df = df.sort_values(by=['machine_id', 'date'], kind='mergesort')
+    grouped = df.groupby('machine_id', sort=False)
+    yesterday_coins_in = grouped['coins_in'].shift(fill_value=0)
+    yesterday_toys_payout = grouped['toys_payout'].shift(fill_value=0)
+    yesterday_coins_in = yesterday_coins_in.where(df['coins_in'] >= yesterday_coins_in, 0)
+    yesterday_toys_payout = yesterday_toys_payout.where(df['toys_payout'] >= yesterday_toys_payout, 0)
+
+    deltas = pd.DataFrame({
+        'machine_id': df['machine_id'],
+        'date': df['date'],
+        'daily_coins_in': df['coins_in'] - yesterday_coins_in,
+        'daily_toys_payout': df['toys_payout'] - yesterday_toys_payout,
+    })
+    deltas = deltas[grouped.cumcount() > 0].reset_index(drop=True)
+    deltas['daily_payout_rate'] = payout_rate(deltas['daily_coins_in'], deltas['daily_toys_payout'])
+    return deltas
+
+
+def empty_result() -> Tuple[pd.DataFrame, float, float]:
+    return pd.DataFrame(columns=RESULT_COLUMNS), 0.0, 0.0
+
+
+def last_payout_rate(analyze_result: pd.DataFrame) -> float:
+    """Payout rate of the most recent day, 0 for machines without any deltas yet"""
+    if analyze_result.empty:
+        return 0.0
+    return analyze_result['daily_payout_rate'].iloc[-1]
+
+
+def summarize_payout_rates(deltas: pd.DataFrame, last_n_days: int = 3) -> Dict[str, Tuple[pd.DataFrame, float, float]]:
+    """
+    Build the (analyze_result, all_time_payout_rate, last_n_days_payout_rate) tuple for every machine
+    from the output of compute_daily_deltas.
+    """
+    if deltas.empty:
+        return {}
+    grouped = deltas.groupby('machine_id', sort=False)
+    totals = grouped[['daily_coins_in', 'daily_toys_payout']].sum()
+    recent = grouped.tail(last_n_days).groupby('machine_id', sort=False)[['daily_coins_in', 'daily_toys_payout']].sum()
+    all_time = payout_rate(totals['daily_coins_in'], totals['daily_toys_payout'])
+    last_n = payout_rate(recent['daily_coins_in'], recent['daily_toys_payout'])
+
+    results = {}
+    for machine_id, machine_deltas in grouped:
+        analyze_result = machine_deltas[RESULT_COLUMNS].reset_index(drop=True)
+        results[machine_id] = (analyze_result, float(all_time[machine_id]), float(last_n[machine_id]))
+    return results
+
+
+def calculate_payout_rates(records: pd.DataFrame, last_n_days: int = 3) -> Dict[str, Tuple[pd.DataFrame, float, float]]:
+    """Payout analysis for every machine in a records frame, keyed by machine id"""
+    if records.empty:
+        return {}
+    return summarize_payout_rates(compute_daily_deltas(records), last_n_days)
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+from typing import Tuple
+
+from backend.fleet_cube import to_epoch_days
+from backend.payout import payout_rate
+
+WINDOW_OPTIONS = [1, 3, 7, 30]
+
+
+class RollingMetrics:
+    """
+    Cumulative prefix sums of per-machine daily coins_in / toys_payout.
+    Any window of days is answered with two lookups per machine, so changing the window never rescans history.
+    Windows are calendar days ending at the last day covered.
+    """
+    def __init__(self, machine_ids, start_day, coins_in, toys_payout):
+        self.machine_ids = np.asarray(machine_ids, dtype=str)
+        self.start_day = int(start_day)
+        n_machines = len(self.machine_ids)
+        zeros = np.zeros((n_machines, 1), dtype=np.int64)
+        self.coins_prefix = np.hstack([zeros, np.cumsum(coins_in, axis=1, dtype=np.int64)])
+        self.toys_prefix = np.hstack([zeros, np.cumsum(toys_payout, axis=1, dtype=np.int64)])
+        self._index = {machine_id: i for i, machine_id in enumerate(self.machine_ids)}
+
+    @classmethod
+    def from_daily_stats(cls, stats: pd.DataFrame, since, until) -> 'RollingMetrics':
+        """From daily_stats rows (machine_id, date, coins_in, toys_payout), covering the dates in [since, until]"""
+        start_day = int(to_epoch_days([since])[0])
+        n_days = int(to_epoch_days([until])[0]) - start_day + 1
+        machine_ids = np.unique(stats['machine_id'].to_numpy(dtype=str))
+        coins_in = np.zeros((len(machine_ids), n_days), dtype=np.int64)
+        toys_payout = np.zeros((len(machine_ids), n_days), dtype=np.int64)
+        if not stats.empty:
+            rows = np.searchsorted(machine_ids, stats['machine_id'].to_numpy(dtype=str))
+            cols = to_epoch_days(stats['date']) - start_day
+            inside = (cols >= 0) & (cols < n_days)
+            np.add.at(coins_in, (rows[inside], cols[inside]), stats['coins_in'].to_numpy(dtype=np.int64)[inside])
+            np.add.at(toys_payout, (rows[inside], cols[inside]), stats['toys_payout'].to_numpy(dtype=np.int64)[inside])
+        return cls(machine_ids, start_day, coins_in, toys_payout)
+
+    @property
+    def n_days(self) -> int:
+        return self.coins_prefix.shape[1] - 1
+
+    def _bounds(self, n_days=None, since=None, until=None) -> Tuple[int, int]:
+        """Half-open [start, end) column range for a trailing window or an inclusive date range"""
+        start, end = 0, self.n_days
+        if n_days is not None:
+            start = end - n_days
+        if since is not None:
+            start = int(to_epoch_days([since])[0]) - self.start_day
+        if until is not None:
+            end = int(to_epoch_days([until])[0]) - self.start_day + 1
+        start = min(max(start, 0), self.n_days)
+        end = min(max(end, start), self.n_days)
+        return start, end
+
+    def window(self, n_days: int = None, since=None, until=None) -> pd.DataFrame:
+        """coins_in, toys_payout and payout_rate per machine over a window"""
+        start, end = self._bounds(n_days, since, until)
+        totals = pd.DataFrame({
+            'coins_in': self.coins_prefix[:, end] - self.coins_prefix[:, start],
+            'toys_payout': self.toys_prefix[:, end] - self.toys_prefix[:, start],
+        }, index=pd.Index(self.machine_ids, name='machine_id'))
+        totals['payout_rate'] = payout_rate(totals['coins_in'], totals['toys_payout'])
+        return totals
+
+    def machine_window(self, machine_id, n_days: int = None, since=None, until=None) -> Tuple[int, int, float]:
+        """(coins_in, toys_payout, payout_rate) of one machine over a window, 0s for unknown machines"""
+        i = self._index.get(machine_id)
+        if i is None:
+            return 0, 0, 0.0
+        start, end = self._bounds(n_days, since, until)
+        coins_in = int(self.coins_prefix[i, end] - self.coins_prefix[i, start])
+        toys_payout = int(self.toys_prefix[i, end] - self.toys_prefix[i, start])
+        return coins_in, toys_payout, payout_rate(coins_in, toys_payout)
+
+    def fleet_window(self, n_days: int = None, since=None, until=None) -> Tuple[int, int, float]:
+        """(coins_in, toys_payout, payout_rate) summed over all machines"""
+        totals = self.window(n_days, since, until)
+        coins_in = int(totals['coins_in'].sum())
+        toys_payout = int(totals['toys_payout'].sum())
+        return coins_in, toys_payout, payout_rate(coins_in, toys_payout)
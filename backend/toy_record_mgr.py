@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 from dataclasses import dataclass
 from tinydb import Query
 from models.machines import Record, Machine
@@ -8,13 +8,96 @@ from io import BytesIO
 import streamlit as st
 import uuid
 from dataclasses import field
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import numpy as np
 import pandas as pd
 import logging
 from dataclasses import asdict
-from models.machines import IncomeRecord
+from models.machines import IncomeRecord, DailyStat
+from backend.fleet_cube import FleetCube, to_epoch_days
+from backend.rolling import RollingMetrics, WINDOW_OPTIONS
+from backend.chart_cache import cached_chart
+from backend.downsample import downsample, MAX_PLOT_POINTS
+from backend.parallel import run_sharded
+from backend.payout import calculate_payout_rates, compute_daily_deltas, empty_result, last_payout_rate, payout_rate
+from db.async_firestore import AsyncFirestoreDB, run_async
+from db.firestore import BatchWriteError
+import asyncio
+import threading
 logger = logging.getLogger(__name__)
 
+# the record fields the analytics need
+METER_FIELDS = ['machine_id', 'date', 'coins_in', 'toys_payout']
+# the record fields of the detail tables
+DETAIL_FIELDS = ['date', 'coins_in', 'toys_payout', 'param_strong_strength',
+                 'param_medium_strength', 'param_weak_strength',
+                 'param_award_interval', 'param_mode', 'notes']
+# seconds, updated_at is assigned at commit, so a write can become visible after a later one was seen
+CUBE_SYNC_OVERLAP = 60
+# days before a machine's earliest changed record searched for its baseline reading in the same read
+BASELINE_LOOKBACK_DAYS = 30
+# days before the earliest written reading searched for the readings its daily_stats are differenced against
+STATS_LOOKBACK_DAYS = 7
+# the daily_stats fields the rolling windows need
+DAILY_STAT_FIELDS = ['machine_id', 'date', 'coins_in', 'toys_payout']
+
+
+class IncomeRecordsCache:
+    """Raw cumulative income records already fetched, shared by all sessions of an env"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.raw = None
+
+    def since(self):
+        """The date to fetch records from, the last cached one is refetched as it may have been updated"""
+        return self.raw['date'].iloc[-1] if self.raw is not None and not self.raw.empty else None
+
+    def merge(self, records, incremental=True):
+        """Merge fetched records into the cache and return all of them, sorted by date"""
+        raw = self.raw if incremental else None
+        new_records = pd.DataFrame(records)
+        if not new_records.empty:
+            new_records['date'] = pd.to_datetime(new_records['date']).dt.strftime("%Y-%m-%d")
+            raw = pd.concat([raw, new_records], ignore_index=True) if raw is not None else new_records
+            raw = raw.drop_duplicates(subset='date', keep='last')
+            raw = raw.sort_values(by='date', ascending=True).reset_index(drop=True)
+        self.raw = raw
+        return raw
+
+
+@st.cache_resource
+def get_income_records_cache(env):
+    return IncomeRecordsCache()
+
+
+class FleetCubeCache:
+    """The fleet cube of an env, shared by all sessions; replaced, never mutated"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cube = None
+
+
+@st.cache_resource
+def get_fleet_cube_cache(env):
+    return FleetCubeCache()
+
+
+def updated_mark(records: pd.DataFrame) -> float:
+    """Newest updated_at of the records in epoch seconds, 0 when none is stamped"""
+    stamps = pd.to_datetime(records['updated_at'], utc=True).dropna()
+    return stamps.max().timestamp() if len(stamps) else 0.0
+
+
+def machine_param_updates(record: Record):
+    """The machine fields a new record carries over"""
+    return {
+        'param_strong_strength': record.param_strong_strength,
+        'param_medium_strength': record.param_medium_strength,
+        'param_weak_strength': record.param_weak_strength,
+        'param_award_interval': record.param_award_interval,
+        'param_mode': record.param_mode,
+    }
+
 
 class Manager(BaseManager):
     def __init__(self, env):
@@ -23,27 +106,36 @@ class Manager(BaseManager):
     def create_income_record(self, date: str, POS_machine: int, auto_machine: int):
         record = IncomeRecord(date=date, POS_machine=POS_machine, auto_machine=auto_machine, total=0)
         self.firestore_db.create_income_record(asdict(record))
-    
-    def get_all_income_records(self):
-        records = self.firestore_db.get_all_income_records()
-        df = pd.DataFrame(records)
-        if df.empty:
+        # the cached readings from this date on are stale now
+        cache = get_income_records_cache(self.env)
+        with cache.lock:
+            if cache.raw is not None:
+                cache.raw = cache.raw[cache.raw['date'] < date]
+
+    def get_all_income_records(self, incremental=True):
+        """
+        Daily income, with auto_machine differenced from its cumulative readings.
+        In incremental mode only records from the last cached date on are fetched and merged into the shared cache.
+        """
+        cache = get_income_records_cache(self.env)
+        with cache.lock:
+            since = cache.since() if incremental else None
+            raw = cache.merge(self.firestore_db.get_all_income_records(since), incremental)
+        return self.income_table(raw)
+
+    @staticmethod
+    def income_table(raw):
+        """Daily income from the raw cumulative records, None if there are none"""
+        if raw is None or raw.empty:
             return None
-        df['date'] = pd.to_datetime(df['date']).dt.strftime("%Y-%m-%d")
-        df = df.sort_values(by='date', ascending=True)
-        auto_machine_records = df['auto_machine'].tolist()
-        diff_records = [auto_machine_records[0]]
-        for i in range(1, len(auto_machine_records)):
-            if auto_machine_records[i] < auto_machine_records[i-1]:
-                diff_records.append(auto_machine_records[i])
-            else:
-                diff_records.append(auto_machine_records[i] - auto_machine_records[i-1])
-        df['auto_machine'] = pd.Series(diff_records)
+        df = raw.copy()
+        previous = df['auto_machine'].shift(fill_value=0)
+        # a lower reading than the day before means the counter was reset
+        df['auto_machine'] = df['auto_machine'] - previous.where(df['auto_machine'] >= previous, 0)
         df['total'] = df['POS_machine'] + df['auto_machine']
         selected_columns = ['date', 'POS_machine', 'auto_machine', 'total']
         return df[selected_columns]
 
-
     def create_machine(self, machine: Machine, image: BytesIO):
         if image is not None:
             # upload image to blob storage
@@ -54,11 +146,13 @@ class Manager(BaseManager):
         self.firestore_db.create_machine(asdict(machine))
 
     def get_all_machines(self):
-        all_machines = self.firestore_db.get_all_machines()
+        return self.sort_machines(self.firestore_db.get_all_machines())
+
+    @staticmethod
+    def sort_machines(all_machines):
         # sort by id, only keep the numbers in the id
         numbers = '1234567890'
-        all_machines = sorted(all_machines, key=lambda x: int(''.join(filter(lambda c: c in numbers, x['id']))))
-        return all_machines
+        return sorted(all_machines, key=lambda x: int(''.join(filter(lambda c: c in numbers, x['id']))))
 
     def get_all_machines_obj(self):
         machines = self.get_all_machines()
@@ -72,6 +166,15 @@ class Manager(BaseManager):
         image = get_image_by_path(path, self.blob_db)
         return image
 
+    def get_images_by_machine_ids(self, machine_ids):
+        """Images of several machines keyed by id (None when a machine has no image), one machines read"""
+        machines = self.firestore_db.get_many('machines', machine_ids)
+        images = {}
+        for machine_id in machine_ids:
+            path = machines.get(machine_id, {}).get('image')
+            images[machine_id] = get_image_by_path(path, self.blob_db) if path is not None else None
+        return images
+
     def get_machine_by_id(self, machine_id):
         return self.firestore_db.get_machine_by_id(machine_id)
 
@@ -82,126 +185,378 @@ class Manager(BaseManager):
     def update_machine(self, machine_id, machine):
         self.firestore_db.update_machine(machine_id, machine)
 
-    def delete_machine(self, machine_id):
-        machine = self.get_machine_by_id(machine_id)
+    def delete_machine(self, machine_id, machine=None):
+        if machine is None:
+            machine = self.get_machine_by_id(machine_id)
         self.firestore_db.delete_machine(machine_id)
         if machine['image'] is not None:
             self.blob_db.delete_file(machine['image'])
 
     def create_record(self, record: Record):
-        self.firestore_db.create_record(asdict(record))
+        """
+        Write the record, the machine's param_* fields and the daily_stats rows the record changes in one batch.
+        The machine is updated with a field mask, so concurrent edits to other fields survive.
+        """
+        self.firestore_db.write_batch([
+            ('set', 'records', record.id, asdict(record)),
+            ('update', 'machines', record.machine_id, machine_param_updates(record)),
+        ] + self.daily_stat_operations([record]))
+
+    def create_record_transactional(self, record: Record):
+        """
+        create_record in a transaction, where ordering matters: the machine is read inside it, so records
+        for the same machine commit one after another and the last committed one sets the machine's params.
+        """
+        def build_operations(results):
+            if not results[0]:
+                raise ValueError(f"Machine {record.machine_id} not found")
+            return [
+                ('set', 'records', record.id, asdict(record)),
+                ('update', 'machines', record.machine_id, machine_param_updates(record)),
+            ]
+
+        reads = [dict(collection_name='machines', filters=[('id', '==', record.machine_id)], limit=1)]
+        self.firestore_db.run_transaction(reads, build_operations)
+        # the daily_stats rows are derived, they are written after the commit instead of reading neighbours in it
+        self.write_daily_stats([record])
+
+    def validate_record(self, record: Record, machines) -> Optional[str]:
+        """Why a record cannot be saved, None when it is fine. machines is a dict of machine documents by id"""
+        if record.machine_id not in machines:
+            return f"Machine {record.machine_id} not found"
+        if not isinstance(record.coins_in, int) or not isinstance(record.toys_payout, int):
+            return "Coins in and toys payout must be whole numbers"
+        if record.coins_in <= 0 or record.toys_payout <= 0:
+            return "Coins in and toys payout must be greater than 0"
+        return None
+
+    def create_records(self, records: List[Record]):
+        """
+        Validate every record first, then write all valid records and their machine parameter updates
+        in as few batched commits as possible.
+        Returns one {'machine_id', 'record_id', 'saved', 'error'} dict per input record.
+        """
+        machines = self.firestore_db.get_many('machines', [record.machine_id for record in records])
+        results = []
+        valid_records = []
+        for record in records:
+            error = self.validate_record(record, machines)
+            results.append({'machine_id': record.machine_id, 'record_id': record.id, 'saved': error is None, 'error': error})
+            if error is None:
+                valid_records.append(record)
+        if not valid_records:
+            return results
+
+        operations = []
+        # index of each record's set in operations
+        record_operations = {}
+        for record in valid_records:
+            record_operations[record.id] = len(operations)
+            operations.append(('set', 'records', record.id, asdict(record)))
+            operations.append(('update', 'machines', record.machine_id, machine_param_updates(record)))
+        committed = len(operations)
+        try:
+            self.firestore_db.write_batch(operations)
+        except BatchWriteError as e:
+            # earlier commits are applied, only the records from the failed commit on are not saved
+            committed = e.committed
+            logger.error(f"Error saving records after {e.committed} of {len(operations)} operations: {e}")
+            for result in results:
+                if result['saved'] and record_operations[result['record_id']] >= e.committed:
+                    result['saved'] = False
+                    result['error'] = str(e)
+        self.write_daily_stats([record for record in valid_records if record_operations[record.id] < committed])
+        return results
+
+    def daily_stats_for_records(self, records: List[Record]) -> List[DailyStat]:
+        """
+        The daily_stats rows that depend on these readings: each reading's day and the day of the machine's
+        next reading, summed over every reading of those days as written.
+        The earlier readings come from one records read starting STATS_LOOKBACK_DAYS before the earliest
+        reading, the neighbour query is only needed for machines with no reading before theirs in it.
+        """
+        if not records:
+            return []
+        fields = ['id'] + METER_FIELDS
+        written = pd.DataFrame([asdict(record) for record in records], columns=fields)
+        since = (pd.Timestamp(written['date'].min()[:10]) - pd.Timedelta(days=STATS_LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+        stored = self.get_all_records_df(since=since, fields=fields)
+        stored = stored[stored['machine_id'].isin(written['machine_id'])]
+        # a saved record replaces its stored version, the days that version was counted in change too
+        replaced = stored['id'].isin(written['id'])
+        changed = pd.concat([written, stored[replaced]], ignore_index=True)
+        readings = pd.concat([stored[~replaced], written], ignore_index=True)
+
+        first_days = changed.groupby('machine_id')['date'].min().str[:10]
+        earlier = readings[readings['date'] < readings['machine_id'].map(first_days)]['machine_id'].unique()
+        previous = [self.get_neighbour_record(machine_id, first_day, before=True)
+                    for machine_id, first_day in first_days.items() if machine_id not in earlier]
+        previous = pd.DataFrame([reading for reading in previous if reading is not None], columns=fields)
+        readings = pd.concat([previous[~previous['id'].isin(written['id'])], readings], ignore_index=True)
+        readings = readings.sort_values(by=['machine_id', 'date'], kind='mergesort')
+
+        dates = {machine_id: machine_readings['date'].reset_index(drop=True)
+                 for machine_id, machine_readings in readings.groupby('machine_id', sort=False)}
+        days = set()
+        for machine_id, date in zip(changed['machine_id'], changed['date']):
+            days.add((machine_id, date[:10]))
+            following = dates[machine_id].searchsorted(date, side='right')
+            if following < len(dates[machine_id]):
+                days.add((machine_id, dates[machine_id][following][:10]))
+
+        deltas = compute_daily_deltas(readings)
+        deltas['date'] = deltas['date'].dt.strftime("%Y-%m-%d")
+        daily = deltas.groupby(['machine_id', 'date'])[['daily_coins_in', 'daily_toys_payout']].sum()
+        stats = []
+        for machine_id, date in sorted(days):
+            coins_in, toys_payout = daily.loc[(machine_id, date)].tolist() if (machine_id, date) in daily.index else (0, 0)
+            stats.append(DailyStat(machine_id=machine_id, date=date, coins_in=int(coins_in), toys_payout=int(toys_payout),
+                                   payout_rate=float(payout_rate(int(coins_in), int(toys_payout)))))
+        return stats
+
+    def daily_stat_operations(self, records: List[Record]):
+        """write_batch operations setting the daily_stats rows that depend on these readings"""
+        return [('set', 'daily_stats', stat.id, asdict(stat)) for stat in self.daily_stats_for_records(records)]
+
+    def write_daily_stats(self, records: List[Record]):
+        """
+        Write the daily_stats rows of readings already committed. The rows are derived, so a failure is only
+        logged, sync_daily_stats rewrites the rows that differ from the fleet cube.
+        """
+        try:
+            self.firestore_db.write_batch(self.daily_stat_operations(records))
+        except Exception as e:
+            logger.error(f"Error saving daily stats of {len(records)} records: {e}")
+
+    def sync_daily_stats(self, n_days=max(WINDOW_OPTIONS)):
+        """
+        Write the daily_stats rows of the last n_days that are missing or differ from the fleet cube:
+        history from before the rows were maintained and rows whose write failed after their records.
+        Returns the number of rows written.
+        """
+        cube = self.get_fleet_cube()
+        since = (datetime.now() - timedelta(days=n_days - 1)).strftime("%Y-%m-%d")
+        first = min(max(int(to_epoch_days([since])[0]) - cube.start_day, 0), cube.n_days)
+        n_window = cube.n_days - first
+        expected = pd.DataFrame({
+            'machine_id': np.repeat(cube.machine_ids, n_window),
+            'date': np.tile(cube.dates[first:].astype(str), len(cube.machine_ids)),
+            'coins_in': cube.coins_in[:, first:].ravel().astype(np.int64),
+            'toys_payout': cube.toys_payout[:, first:].ravel().astype(np.int64),
+        })
+        stored = pd.DataFrame(self.firestore_db.get_daily_stats(since), columns=DAILY_STAT_FIELDS)
+        merged = expected.merge(stored, on=['machine_id', 'date'], how='outer', suffixes=('', '_stored'))
+        merged[['coins_in', 'toys_payout']] = merged[['coins_in', 'toys_payout']].fillna(0).astype(np.int64)
+        missing = merged['coins_in_stored'].isna()
+        differs = (merged['coins_in'] != merged['coins_in_stored']) | (merged['toys_payout'] != merged['toys_payout_stored'])
+        nonzero = (merged['coins_in'] != 0) | (merged['toys_payout'] != 0)
+        stale = merged[(missing & nonzero) | (~missing & differs)]
+        operations = []
+        for machine_id, date, coins_in, toys_payout in stale[DAILY_STAT_FIELDS].itertuples(index=False):
+            stat = DailyStat(machine_id=machine_id, date=date, coins_in=int(coins_in), toys_payout=int(toys_payout),
+                             payout_rate=float(payout_rate(int(coins_in), int(toys_payout))))
+            operations.append(('set', 'daily_stats', stat.id, asdict(stat)))
+        if operations:
+            self.firestore_db.write_batch(operations)
+        return len(operations)
+
+    @staticmethod
+    def rolling_window_dates():
+        """(since, until) of the daily_stats every window option reads, ending today"""
+        today = datetime.now()
+        return (today - timedelta(days=max(WINDOW_OPTIONS) - 1)).strftime("%Y-%m-%d"), today.strftime("%Y-%m-%d")
+
+    def get_rolling_metrics(self):
+        """Rolling metrics of the window options, from the precomputed daily_stats rows"""
+        since, until = self.rolling_window_dates()
+        stats = pd.DataFrame(self.firestore_db.get_daily_stats(since, until), columns=DAILY_STAT_FIELDS)
+        return RollingMetrics.from_daily_stats(stats, since, until)
+
+    def get_all_records(self, since=None, until=None, fields=None):
+        return self.firestore_db.get_all_records(since, until, fields)
+
+    def get_all_records_df(self, since=None, until=None, fields=None):
+        records = self.get_all_records(since, until, fields)
+        return pd.DataFrame(records, columns=fields)
+
+    def fleet_cube_path(self):
+        return f"analytics/fleet_cube_{self.blob_db.env}.npz"
+
+    def get_fleet_cube(self):
+        """
+        The shared fleet cube, refreshed with the records written since it was last refreshed.
+        Blob storage is only read on the first use in a process and written when the cube changed.
+        """
+        cache = get_fleet_cube_cache(self.env)
+        with cache.lock:
+            if cache.cube is None:
+                cache.cube = self.load_fleet_cube()
+            refreshed = self.refresh_fleet_cube(cache.cube)
+            if refreshed is not None:
+                self.save_fleet_cube(refreshed)
+                cache.cube = refreshed
+            return cache.cube
+
+    def load_fleet_cube(self):
+        """The persisted cube, rebuilt from the full history when there is none or it predates updated_mark"""
+        path = self.fleet_cube_path()
+        if self.blob_db.file_exists(path):
+            cube = FleetCube.from_npz_bytes(self.blob_db.download_file(path))
+            if cube.updated_mark is not None:
+                return cube
+        fields = METER_FIELDS + ['updated_at']
+        records = self.get_all_records_df(fields=fields)
+        cube = FleetCube.from_records(records)
+        cube.updated_mark = updated_mark(records)
+        self.save_fleet_cube(cube)
+        return cube
+
+    def refresh_fleet_cube(self, cube: FleetCube):
+        """
+        A copy of the cube with every machine that has records written since its updated_mark recomputed
+        from the day of its earliest changed record, so corrected and back-dated readings are picked up
+        as well as new ones. None when nothing changed.
+        """
+        fields = METER_FIELDS + ['updated_at']
+        since = datetime.fromtimestamp(cube.updated_mark - CUBE_SYNC_OVERLAP, timezone.utc)
+        changed = pd.DataFrame(self.firestore_db.query('records', filters=[('updated_at', '>', since)], fields=fields),
+                               columns=fields)
+        if changed.empty:
+            return None
+        from_dates = changed.groupby('machine_id')['date'].min().str[:10]
+        lookback = (pd.Timestamp(from_dates.min()) - pd.Timedelta(days=BASELINE_LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+        records = self.get_all_records_df(since=lookback, fields=METER_FIELDS)
+        records = records[records['machine_id'].isin(from_dates.index)].sort_values(by='date', kind='mergesort')
+        after = records['date'] >= records['machine_id'].map(from_dates)
+        # the baseline is each machine's last reading before its from date, the neighbour query is
+        # only needed for machines with no reading in the lookback, e.g. ones that are new
+        baselines = records[~after].groupby('machine_id', sort=False).tail(1)
+        records = records[after]
+        missing = [self.get_neighbour_record(machine_id, from_dates[machine_id], before=True)
+                   for machine_id in from_dates.index.difference(baselines['machine_id'])]
+        baselines = pd.concat([baselines, pd.DataFrame([baseline for baseline in missing if baseline is not None],
+                                                       columns=METER_FIELDS)], ignore_index=True)
+
+        refreshed = cube.copy()
+        from_days = dict(zip(from_dates.index, to_epoch_days(from_dates.values).tolist()))
+        refreshed.updated_mark = max(cube.updated_mark, updated_mark(changed))
+        if not refreshed.rewrite(from_days, records, baselines) and refreshed.updated_mark == cube.updated_mark:
+            return None
+        return refreshed
 
-        # update machine parameters
-        machine_id = record.machine_id
-        machine = self.get_machine_by_id(machine_id)
-        machine['param_strong_strength'] = record.param_strong_strength
-        machine['param_medium_strength'] = record.param_medium_strength
-        machine['param_weak_strength'] = record.param_weak_strength
-        machine['param_award_interval'] = record.param_award_interval
-        machine['param_mode'] = record.param_mode
-        self.update_machine(machine_id, machine)
-
-    def get_all_records(self):
-        return self.firestore_db.get_all_records()
-
-    def get_all_records_df(self):
-        records = self.get_all_records()
-        return pd.DataFrame(records)
-
-    def get_records_by_machine_id(self, machine_id):
-        keys = ['date', 'coins_in', 'toys_payout', 'param_strong_strength', 
-                'param_medium_strength', 'param_weak_strength', 
-                'param_award_interval', 'param_mode', 'notes']
-        records = self.firestore_db.get_records_by_machine_id(machine_id)
-        df = pd.DataFrame(records)
-        # sort by date
-        df = df.sort_values(by='date', ascending=False)
-        return df[keys]
+    def save_fleet_cube(self, cube: FleetCube):
+        self.blob_db.upload_bytes(cube.to_npz_bytes(), self.fleet_cube_path())
+
+    def get_all_records_detail_df(self, since=None, until=None):
+        """Every machine's records with the detail fields and machine_id, from one read"""
+        return self.get_all_records_df(since, until, fields=['machine_id'] + DETAIL_FIELDS)
+
+    @staticmethod
+    def split_records_by_machine_id(records):
+        """A records frame split into per-machine frames of the detail fields, newest first, keyed by machine id"""
+        records = records.sort_values(by='date', ascending=False, kind='mergesort')
+        return {machine_id: machine_records[DETAIL_FIELDS].reset_index(drop=True)
+                for machine_id, machine_records in records.groupby('machine_id', sort=False)}
+
+    def count_records_by_machine_ids(self, machine_ids):
+        """Number of records of each machine, from the one full records read the analytics pages share"""
+        counts = self.get_all_records_df(fields=METER_FIELDS)['machine_id'].value_counts()
+        return {machine_id: int(counts.get(machine_id, 0)) for machine_id in machine_ids}
 
     def save_record(self, record: Record):
-        self.firestore_db.save_record(asdict(record))
+        """Write the record and the daily_stats rows it changes in one batch"""
+        self.firestore_db.write_batch([('set', 'records', record.id, asdict(record))] + self.daily_stat_operations([record]))
+
+    def neighbour_query(self, machine_id, date, before=True):
+        """query() arguments for the machine's closest reading strictly before (or after) a date"""
+        return dict(
+            collection_name='records',
+            filters=[('machine_id', '==', machine_id), ('date', '<' if before else '>', date)],
+            order_by=('date', 'desc' if before else 'asc'),
+            limit=1,
+        )
+
+    def get_neighbour_record(self, machine_id, date, before=True):
+        """The machine's closest reading strictly before (or after) a date, None if there is none"""
+        records = self.firestore_db.query(**self.neighbour_query(machine_id, date, before))
+        return records[0] if records else None
 
     def get_all_machines_payout_rate(self):
         machines = self.get_all_machines_obj()
+        all_payout_rates = self.calculate_all_machines_payout_rates()
         all_results = []
         for machine in machines:
             machine_id = machine.id
-            analyze_result, all_time_payout_rate, last_3_days_payout_rate = self.calculate_machine_payout_rate(machine_id)
+            analyze_result, all_time_payout_rate, last_3_days_payout_rate = all_payout_rates.get(machine_id, empty_result())
             logger.info(f"results for {machine.name}: {analyze_result}")
             all_results.append({
                 'machine_id': machine_id,
-                'last_day_payout_rate': analyze_result['daily_payout_rate'].iloc[-1],
+                'last_day_payout_rate': last_payout_rate(analyze_result),
                 'all_time_payout_rate': all_time_payout_rate,
                 'last_3_days_payout_rate': last_3_days_payout_rate
             })
         return all_results
 
-    def calculate_machine_payout_rate(self, machine_id):
-        records = self.get_records_by_machine_id(machine_id)
-        processed_records = []
-        # daily payout rate
-        records['date'] = pd.to_datetime(records['date'])
-        records_sorted = records.sort_values(by='date', ascending=True)
-        for i in range(1, records.shape[0]):
-            yesterday_coins_in = records_sorted.iloc[i-1]['coins_in']
-            yesterday_toys_payout = records_sorted.iloc[i-1]['toys_payout']
-            today_coins_in = records_sorted.iloc[i]['coins_in']
-            today_toys_payout = records_sorted.iloc[i]['toys_payout']
-            
-            if today_coins_in < yesterday_coins_in:
-                yesterday_coins_in = 0
-            if today_toys_payout < yesterday_toys_payout:
-                yesterday_toys_payout = 0
-
-            coins_diff = today_coins_in - yesterday_coins_in
-            toys_diff = today_toys_payout - yesterday_toys_payout
-            if coins_diff == 0 or toys_diff == 0:
-                daily_payout_rate = 0
-            else:
-                daily_payout_rate = coins_diff / toys_diff
-
-            processed_records.append({
-                'date': records_sorted.iloc[i]['date'],
-                'daily_coins_in': coins_diff,
-                'daily_toys_payout': toys_diff,
-                'daily_payout_rate': daily_payout_rate,
-            })
-
-        processed_records = pd.DataFrame(processed_records)
-        # all time payout rate
-        total_coins_in = processed_records['daily_coins_in'].sum()
-        total_toys_payout = processed_records['daily_toys_payout'].sum()
-        if total_coins_in == 0 or total_toys_payout == 0:
-            all_time_payout_rate = 0.0
-        else:
-            all_time_payout_rate = total_coins_in / total_toys_payout 
-
-        # last 3-day payout rate
-        last_3_days_records = processed_records.tail(3)
-        last_3_days_coins_in = last_3_days_records['daily_coins_in'].sum()
-        last_3_days_toys_payout = last_3_days_records['daily_toys_payout'].sum()
-        if last_3_days_coins_in == 0 or last_3_days_toys_payout == 0:
-            last_3_days_payout_rate = 0.0
-        else:
-            last_3_days_payout_rate = last_3_days_coins_in / last_3_days_toys_payout
-
-        result = {
-            'daily_payout_rate': processed_records['daily_payout_rate'].tolist(),
-            'daily_coins_in': processed_records['daily_coins_in'].tolist(),
-            'daily_toys_payout': processed_records['daily_toys_payout'].tolist(),
-            'date': processed_records['date'].tolist()
-        }
-
-        return pd.DataFrame(result), all_time_payout_rate, last_3_days_payout_rate
-
-
-    def plot_analyze_result(self, analyze_result):
+    def calculate_all_machines_payout_rates(self, last_n_days=3, parallel=None, since=None, until=None, records=None):
+        """
+        Payout analysis for every machine from a single records query, keyed by machine id.
+        With since/until only that date window is read; its first reading per machine is the baseline,
+        so the all-time rate covers the window only. records, a frame with at least METER_FIELDS the
+        caller already read, replaces the query.
+        With parallel large histories are sharded by machine over a process pool, by default when
+        PARALLEL_ANALYTICS is set in the ENV secrets.
+        """
+        if parallel is None:
+            parallel = bool(st.secrets['ENV'].get('PARALLEL_ANALYTICS', False))
+        if records is None:
+            records = self.get_all_records_df(since, until, fields=METER_FIELDS)
+        records = records[METER_FIELDS]
+        if parallel:
+            return run_sharded(calculate_payout_rates, records, last_n_days)
+        return calculate_payout_rates(records, last_n_days)
+
+    async def load_dashboard_data_async(self, since=None, last_n_days=3):
+        """
+        Everything the dashboard reads, fetched concurrently:
+        (income table, Machine objects, payout analysis per machine since `since`, fleet cube,
+        rolling metrics from daily_stats).
+        """
+        db = AsyncFirestoreDB(self.firestore_db)
+        cache = get_income_records_cache(self.env)
+        with cache.lock:
+            income_since = cache.since()
+        stats_since, stats_until = self.rolling_window_dates()
+        income_records, machines, records, stats, cube = await asyncio.gather(
+            db.get_all_income_records(income_since),
+            db.get_all_machines(),
+            db.get_all_records(since, fields=METER_FIELDS),
+            db.get_daily_stats(stats_since, stats_until),
+            # the shared cube only needs the synchronous refresh query once it is loaded
+            asyncio.to_thread(self.get_fleet_cube),
+        )
+        with cache.lock:
+            if cache.since() != income_since:
+                # the cache changed during the fetch, e.g. a new income record dropped the readings it
+                # covered, so the fetched records may leave a gap; fetch again from the current since
+                income_records = self.firestore_db.get_all_income_records(cache.since())
+            income = self.income_table(cache.merge(income_records))
+        machines = [Machine(**machine) for machine in self.sort_machines(machines)]
+        payout_rates = calculate_payout_rates(pd.DataFrame(records, columns=METER_FIELDS), last_n_days)
+        rolling_metrics = RollingMetrics.from_daily_stats(pd.DataFrame(stats, columns=DAILY_STAT_FIELDS), stats_since, stats_until)
+        return income, machines, payout_rates, cube, rolling_metrics
+
+    def load_dashboard_data(self, since=None, last_n_days=3):
+        """load_dashboard_data_async for synchronous pages"""
+        return run_async(self.load_dashboard_data_async(since, last_n_days))
+
+    def plot_analyze_result(self, analyze_result, max_points=MAX_PLOT_POINTS):
         # Combine daily_coins_in and daily_toys_payout into a single DataFrame
         combined_df = pd.DataFrame({
             'daily_coins_in': analyze_result['daily_coins_in'],
             'daily_toys_payout': analyze_result['daily_toys_payout'],
             'date': analyze_result['date']
         })
+        combined_df = downsample(combined_df, ['daily_coins_in', 'daily_toys_payout'], max_points)
         
         # Plot daily_coins_in and daily_toys_payout on the same plot
         import matplotlib.pyplot as plt
@@ -211,71 +566,30 @@ class Manager(BaseManager):
         combined_df['day_of_week'] = combined_df['date'].dt.strftime('%a')
         combined_df['date_with_day'] = combined_df['date'].dt.strftime('%m-%d') + '_' + combined_df['day_of_week']
         
-        with col1:
+        def draw_coins_and_toys():
             fig, ax = plt.subplots()
             combined_df.plot(x='date_with_day', y=['daily_coins_in', 'daily_toys_payout'], ax=ax, style='-o')
             ax.set_title('Coins In & Toys Payout')
             ax.grid(True)
-            st.pyplot(fig)
+            return fig
+
+        with col1:
+            st.image(cached_chart(draw_coins_and_toys, 'coins_and_toys', combined_df))
             st.write('coins in & toys payout')
-            # close the plot
-            plt.close(fig)
         
-        analyze_result_df = pd.DataFrame(analyze_result)
+        analyze_result_df = downsample(pd.DataFrame(analyze_result), ['daily_payout_rate'], max_points).copy()
         analyze_result_df['date'] = pd.to_datetime(analyze_result_df['date'])
         analyze_result_df['day_of_week'] = analyze_result_df['date'].dt.strftime('%a')
         analyze_result_df['date_with_day'] = analyze_result_df['date'].dt.strftime('%m-%d') + '_' + analyze_result_df['day_of_week']
-        
-        with col2:
+
+        def draw_payout_rate():
             fig, ax = plt.subplots()
             analyze_result_df.plot(x='date_with_day', y='daily_payout_rate', ax=ax, style='-o')
             ax.set_title('Payout Rate')
             ax.set_ylim(0, 15)
             ax.grid(True)
-            st.pyplot(fig)
-            st.write('payout rate')
-            plt.close(fig)
-
-    def plot_overall_analyze_result(self, all_results):
-        n_days_to_plot = 30
-        if len(all_results[0]['date']) > n_days_to_plot:
-            all_dates = all_results[0]['date'][-n_days_to_plot:]
-        else:
-            all_dates = all_results[0]['date']
-
-        data_by_date = {k: {
-            'daily_payout_rate': [],    
-            'daily_coins_in': [],
-            'daily_toys_payout': []
-        } for k in all_dates}
-
-        for result in all_results:
-            for date in all_dates:
-                if date in result['date'].values:
-                    daily_payout_rate = result['daily_payout_rate'].loc[result['date'] == date].values[0]
-                    daily_coins_in = result['daily_coins_in'].loc[result['date'] == date].values[0]
-                    daily_toys_payout = result['daily_toys_payout'].loc[result['date'] == date].values[0]
-                    
-                    data_by_date[date]['daily_payout_rate'].append(daily_payout_rate)
-                    data_by_date[date]['daily_coins_in'].append(daily_coins_in)
-                    data_by_date[date]['daily_toys_payout'].append(daily_toys_payout)
-            
-        # sum each date
-        for date in all_dates:
-            data_by_date[date]['daily_coins_in'] = sum(data_by_date[date]['daily_coins_in'])
-            data_by_date[date]['daily_toys_payout'] = sum(data_by_date[date]['daily_toys_payout'])
-            data_by_date[date]['daily_payout_rate'] = data_by_date[date]['daily_coins_in'] / data_by_date[date]['daily_toys_payout']
-
-        # for plot
-        df_all = pd.DataFrame(data_by_date).T.reset_index()
-        df1 = pd.DataFrame({
-            'daily_coins_in': df_all['daily_coins_in'],
-            'daily_toys_payout': df_all['daily_toys_payout'],
-            'date': all_dates.values
-        })
-        df2 = pd.DataFrame({
-            'daily_payout_rate': df_all['daily_payout_rate'],
-            'date': all_dates.values
-        })
+            return fig
 
-        return df1, df2
+        with col2:
+            st.image(cached_chart(draw_payout_rate, 'payout_rate', analyze_result_df[['date', 'daily_payout_rate']]))
+            st.write('payout rate')
@@ -44,10 +44,25 @@ class Manager:
 
     def display_user_info(self):
         display_keys = ['phone_number', 'name', 'credits', 'tokens']
-        all_users = self.all_users_to_df()
+        # only download the displayed fields, not the redemption history
+        all_users = pd.DataFrame(self.db.get_collection('users', fields=display_keys), columns=display_keys)
         if all_users.empty:
             return None
-        return all_users[display_keys]
+        return all_users
+
+    def get_users_page(self, page_size=50, cursor=None):
+        """One page of the displayed user fields ordered by phone number, as (rows, cursor)"""
+        display_keys = ['phone_number', 'name', 'credits', 'tokens']
+        return self.db.get_page('users', page_size, order_by='phone_number', start_after=cursor, fields=display_keys)
+
+    def get_user_totals(self):
+        """Number of users and their outstanding credits and tokens"""
+        totals = self.db.aggregate('users', [
+            ('count', None, 'users'),
+            ('sum', 'credits', 'credits'),
+            ('sum', 'tokens', 'tokens'),
+        ])
+        return {key: int(value or 0) for key, value in totals.items()}
 
     def record_redemption(self, phone_number, item, credits):
         user = self.find_user(phone_number)
@@ -65,4 +80,4 @@ class Manager:
     def download_all_data(self):
         import json
         users = self.db.all_users()
-        return json.dumps([user.to_dict() for user in users], indent=2)
+        return json.dumps([user.to_dict() for user in users], indent=2, default=str)
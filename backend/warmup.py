@@ -0,0 +1,89 @@
+import time
+import threading
+import logging
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from backend.toy_record_mgr import Manager, METER_FIELDS
+from utils import get_image_by_path
+
+logger = logging.getLogger(__name__)
+
+# a finished warm-up is repeated after this many seconds, when the shortest cache TTLs have expired
+WARMUP_INTERVAL = 60
+
+
+class WarmUp:
+    """
+    Background prefetch of what the first pages read, into the caches shared by all sessions of an env.
+    Each step runs on its own thread; progress is kept per step for the sidebar.
+    """
+    STEPS = ['machines', 'records', 'income records', 'machine images', 'daily stats']
+
+    def __init__(self, env):
+        self.env = env
+        self.lock = threading.Lock()
+        self.status = {step: 'pending' for step in self.STEPS}
+        self.finished_at = None
+        self.threads = []
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self.threads)
+
+    @property
+    def done(self) -> int:
+        with self.lock:
+            return sum(status != 'pending' for status in self.status.values())
+
+    def start(self, records_since: str = None):
+        """Start the warm-up unless it is running or finished less than WARMUP_INTERVAL seconds ago"""
+        with self.lock:
+            if self.running or (self.finished_at is not None and time.monotonic() - self.finished_at < WARMUP_INTERVAL):
+                return
+            self.status = {step: 'pending' for step in self.STEPS}
+            self.finished_at = None
+            manager = Manager(self.env)
+            loaders = {
+                'machines': manager.get_all_machines,
+                'records': lambda: manager.get_all_records_df(records_since, fields=METER_FIELDS),
+                'income records': manager.get_all_income_records,
+                'machine images': lambda: self._load_images(manager),
+                # fills in daily_stats the write paths did not, from the fleet cube
+                'daily stats': manager.sync_daily_stats,
+            }
+            # the threads use st caches, so they need the session's script context
+            ctx = get_script_run_ctx()
+            self.threads = [threading.Thread(target=self._run, args=(step, loaders[step]), name=f'warmup-{step}', daemon=True)
+                            for step in self.STEPS]
+            for thread in self.threads:
+                add_script_run_ctx(thread, ctx)
+                thread.start()
+
+    @staticmethod
+    def _load_images(manager: Manager):
+        # the machines read is shared with the machines step, concurrent identical reads are coalesced
+        for machine in manager.get_all_machines():
+            if machine.get('image') is not None:
+                get_image_by_path(machine['image'], manager.blob_db)
+
+    def _run(self, step, loader):
+        start = time.monotonic()
+        try:
+            loader()
+            status = 'done'
+            logger.info(f"Warm-up of {step} took {time.monotonic() - start:.2f}s")
+        except Exception as e:
+            # a failed prefetch only means the page fetches it itself
+            status = 'failed'
+            logger.warning(f"Warm-up of {step} failed: {e}")
+        with self.lock:
+            self.status[step] = status
+            if all(status != 'pending' for status in self.status.values()):
+                self.finished_at = time.monotonic()
+
+
+@st.cache_resource
+def get_warmup(env):
+    return WarmUp(env)
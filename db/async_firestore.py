@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import logging
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+
+import streamlit as st
+
+from db.client_registry import get_client_registry
+from db.firestore import FirestoreDB
+
+logger = logging.getLogger(__name__)
+
+
+class EventLoopThread:
+    """
+    A process-wide event loop on a daemon thread.
+    AsyncClients are bound to the loop they first run on, so every async read runs on this one.
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='firestore-async', daemon=True)
+        self.thread.start()
+        self.clients = {}
+
+    def run(self, coroutine: Awaitable, timeout: float = None) -> Any:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def get_async_client(self, env):
+        # only called from coroutines on self.loop, so no lock is needed
+        if env not in self.clients:
+            logger.info(f"Creating Firestore AsyncClient for {env}")
+            self.clients[env] = get_client_registry().create_async_client(env)
+        return self.clients[env]
+
+
+@st.cache_resource
+def get_event_loop_thread():
+    return EventLoopThread()
+
+
+def run_async(coroutine: Awaitable, timeout: float = None) -> Any:
+    """Run a coroutine on the shared event loop and wait for its result, for synchronous Streamlit code"""
+    return get_event_loop_thread().run(coroutine, timeout)
+
+
+class AsyncFirestoreDB:
+    """
+    Async reads on the Firestore AsyncClient, for gathering independent reads concurrently.
+    Shares the read cache, mirror and replica of the FirestoreDB it wraps, with the same cache keys.
+    Writes stay on FirestoreDB.
+    """
+    def __init__(self, firestore_db: FirestoreDB):
+        self.firestore_db = firestore_db
+        self.env = firestore_db.env
+        self.cache = firestore_db.cache
+
+    @property
+    def db(self):
+        return get_event_loop_thread().get_async_client(self.env)
+
+    async def _read(self, collection_name: str, key, filters: List[Tuple[str, str, Any]] = None, order_by=None,
+                    limit: int = None, fields: List[str] = None) -> List[Dict[str, Any]]:
+        # the mirror and replica are synchronous, a replica read may sync over the network first
+        rows = await asyncio.to_thread(self._local_select, collection_name, filters, order_by, limit, fields)
+        if rows is not None:
+            return rows
+        query = self.firestore_db._build_query(collection_name, filters, order_by, limit, fields=fields, client=self.db)
+
+        async def load():
+            return [doc.to_dict() async for doc in query.stream()]
+        return await self.cache.get_or_load_async(collection_name, key, load)
+
+    def _local_select(self, collection_name, filters, order_by, limit, fields) -> Optional[List[Dict[str, Any]]]:
+        local = self.firestore_db._local(collection_name)
+        if local is None:
+            return None
+        return local.select(filters, self.firestore_db._normalize_order_by(order_by), limit, fields)
+
+    async def get_all_income_records(self, since: str = None) -> List[Dict[str, Any]]:
+        filters = [('date', '>=', since)] if since is not None else []
+        return await self._read('income_records', ('all', since), filters)
+
+    async def get_all_machines(self, fields: List[str] = None) -> List[Dict[str, Any]]:
+        return await self._read('machines', ('all', tuple(fields) if fields else None), fields=fields)
+
+    async def get_all_records(self, since: str = None, until: str = None, fields: List[str] = None) -> List[Dict[str, Any]]:
+        filters = []
+        if since is not None:
+            filters.append(('date', '>=', since))
+        if until is not None:
+            filters.append(('date', '<=', until))
+        return await self._read('records', ('all', since, until, tuple(fields) if fields else None), filters, fields=fields)
+
+    async def get_daily_stats(self, since: str = None, until: str = None) -> List[Dict[str, Any]]:
+        filters = []
+        if since is not None:
+            filters.append(('date', '>=', since))
+        if until is not None:
+            filters.append(('date', '<=', until))
+        return await self._read('daily_stats', ('all', since, until), filters)
+
+    async def query(self, collection_name: str, filters: List[Tuple[str, str, Any]] = None, order_by=None,
+                    limit: int = None, fields: List[str] = None) -> List[Dict[str, Any]]:
+        """FirestoreDB.query without cursors"""
+        key = self.firestore_db._query_key(filters, order_by, limit, None, fields)
+        return await self._read(collection_name, key, filters, order_by, limit, fields)
+
+    async def get_records_by_machine_id(self, machine_id: str, since: str = None, until: str = None,
+                                        fields: List[str] = None) -> List[Dict[str, Any]]:
+        filters = [('machine_id', '==', machine_id)]
+        if since is not None:
+            filters.append(('date', '>=', since))
+        if until is not None:
+            filters.append(('date', '<=', until))
+        return await self.query('records', filters=filters, order_by=('date', 'desc'), fields=fields)
@@ -0,0 +1,94 @@
+import copy
+import time
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+import streamlit as st
+
+from db.resilience import Singleflight, retry_call
+
+# seconds a cached read stays valid, per collection
+collection_ttls = {
+    'machines': 300,
+    'records': 60,
+    'daily_stats': 60,
+    'income_records': 60,
+    'users': 60,
+    'orders': 60,
+    'inventory': 60,
+}
+default_ttl = 60
+
+
+class ReadCache:
+    """
+    Read-through cache of Firestore reads, shared by all sessions of an env.
+    Entries are grouped by collection so a write can drop everything read from that collection.
+    Values are deep-copied on the way out because callers mutate what they get back.
+    Concurrent misses of the same key share one load, and loads are retried on transient errors.
+    """
+    def __init__(self, ttls: Dict[str, float] = None):
+        self.ttls = ttls if ttls is not None else collection_ttls
+        self.lock = threading.Lock()
+        self.entries = {}
+        # bumped on every invalidation so loads that raced with a write are not stored
+        self.generations = {}
+        self.hits = 0
+        self.misses = 0
+        self.inflight = Singleflight('firestore')
+
+    def _lookup(self, collection: str, key: Hashable, now: float):
+        """(hit, value, generation) of a cached read"""
+        with self.lock:
+            entry = self.entries.get(collection, {}).get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return True, copy.deepcopy(entry[1]), None
+            self.misses += 1
+            # registered, so clear() also discards this load if it is still running then
+            return False, None, self.generations.setdefault(collection, 0)
+
+    def _store(self, collection: str, key: Hashable, value: Any, generation: int, now: float):
+        with self.lock:
+            if self.generations.get(collection, 0) == generation:
+                ttl = self.ttls.get(collection, default_ttl)
+                entries = self.entries.setdefault(collection, {})
+                # keys carry dates and filters, so expired ones are dropped rather than waiting to be reused
+                for expired in [key for key, entry in entries.items() if entry[0] <= now]:
+                    del entries[expired]
+                entries[key] = (now + ttl, value)
+
+    def get_or_load(self, collection: str, key: Hashable, loader: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        hit, value, generation = self._lookup(collection, key, now)
+        if hit:
+            return value
+        value = self.inflight.do((collection, key), lambda: retry_call('firestore', loader))
+        self._store(collection, key, value, generation, now)
+        return copy.deepcopy(value)
+
+    async def get_or_load_async(self, collection: str, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """get_or_load for a coroutine loader, the entries are shared with synchronous reads"""
+        now = time.monotonic()
+        hit, value, generation = self._lookup(collection, key, now)
+        if hit:
+            return value
+        value = await loader()
+        self._store(collection, key, value, generation, now)
+        return copy.deepcopy(value)
+
+    def invalidate(self, collection: str):
+        with self.lock:
+            self.entries.pop(collection, None)
+            self.generations[collection] = self.generations.get(collection, 0) + 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            for collection in self.generations:
+                self.generations[collection] += 1
+
+
+@st.cache_resource
+def get_read_cache(env):
+    return ReadCache()
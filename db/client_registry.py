@@ -0,0 +1,103 @@
+import time
+import threading
+import logging
+
+import streamlit as st
+from google.cloud import firestore
+from google.oauth2 import service_account
+
+logger = logging.getLogger(__name__)
+
+database_names = {
+    'dev': 'nekoconnect-dev-db',
+    'cloud': 'nekoconnect-db',
+    'prod': 'nekoconnect-db',
+}
+# seconds a health check may take, a hung check should not hold up the session that triggered it
+HEALTH_CHECK_TIMEOUT = 5
+
+
+class ClientRegistry:
+    """
+    Firestore clients shared by every session of the process, one per env.
+    Clients are created on first use and health-checked at most every health_check_interval seconds.
+    The check runs outside the lock, so other sessions keep using the client meanwhile.
+    """
+    def __init__(self, health_check_interval: float = 300):
+        self.health_check_interval = health_check_interval
+        self.lock = threading.Lock()
+        self.clients = {}
+        self.last_checked = {}
+        self.credentials = None
+        self.project_name = None
+
+    def _load_credentials(self):
+        if self.credentials is None:
+            config = dict(st.secrets['Firestore'])
+            self.project_name = config.pop('project_id')
+            self.credentials = service_account.Credentials.from_service_account_info(config)
+
+    def _create_client(self, env):
+        assert env in database_names, "Invalid environment"
+        self._load_credentials()
+        logger.info(f"Creating Firestore client for {env}")
+        return firestore.Client(credentials=self.credentials, database=database_names[env], project=self.project_name)
+
+    @staticmethod
+    def _is_healthy(client) -> bool:
+        try:
+            next(iter(client.collections(retry=None, timeout=HEALTH_CHECK_TIMEOUT)), None)
+            return True
+        except Exception as e:
+            logger.warning(f"Firestore client health check failed: {e}")
+            return False
+
+    def get_firestore_client(self, env) -> firestore.Client:
+        with self.lock:
+            client = self.clients.get(env)
+            now = time.monotonic()
+            if client is None:
+                client = self._create_client(env)
+                self.clients[env] = client
+                self.last_checked[env] = now
+                return client
+            check_due = now - self.last_checked[env] > self.health_check_interval
+            if check_due:
+                # claimed by this caller, concurrent callers skip the check
+                self.last_checked[env] = now
+        if not check_due or self._is_healthy(client):
+            return client
+        with self.lock:
+            # another caller may have replaced or dropped it meanwhile
+            replaced = self.clients.get(env) is client
+            if replaced or env not in self.clients:
+                self.clients[env] = self._create_client(env)
+                self.last_checked[env] = time.monotonic()
+            replacement = self.clients[env]
+        if replaced:
+            client.close()
+        return replacement
+
+    def create_async_client(self, env) -> firestore.AsyncClient:
+        """A new AsyncClient, the caller keeps it on the event loop it is used from"""
+        assert env in database_names, "Invalid environment"
+        with self.lock:
+            self._load_credentials()
+        return firestore.AsyncClient(credentials=self.credentials, database=database_names[env], project=self.project_name)
+
+    def invalidate(self, env):
+        """Drop the client of an env so the next caller builds a fresh one"""
+        with self.lock:
+            client = self.clients.pop(env, None)
+            self.last_checked.pop(env, None)
+        if client is not None:
+            client.close()
+
+
+@st.cache_resource
+def get_client_registry():
+    return ClientRegistry()
+
+
+def get_firestore_client(env) -> firestore.Client:
+    return get_client_registry().get_firestore_client(env)
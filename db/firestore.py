@@ -1,9 +1,13 @@
 from google.cloud import firestore
 from models.users import User
-from typing import Dict, Any, List
+from typing import Dict, Any, Callable, List, Tuple
 from google.cloud.firestore import FieldFilter
-import streamlit as st
-from google.oauth2 import service_account
+from google.cloud.firestore_v1.aggregation import AggregationQuery
+from db.client_registry import get_firestore_client
+from db.cache import get_read_cache
+from db.mirror import get_mirror
+from db.replica import get_replica, DELETIONS_COLLECTION
+from db.resilience import retry_call
 from datetime import datetime, date
 from enum import Enum
 from models.machines import IncomeRecord
@@ -11,80 +15,141 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Firestore rejects batches with more operations than this
+BATCH_LIMIT = 500
+
+
+class BatchWriteError(Exception):
+    """A write_batch commit failed, committed is the number of operations applied by the commits before it"""
+    def __init__(self, committed: int, error: Exception):
+        super().__init__(str(error))
+        self.committed = committed
+
+
 class FirestoreDB:
     def __init__(self, env):
-        if env == 'dev':
-            database_name = 'nekoconnect-dev-db'
-        elif env == 'cloud' or env == 'prod':
-            database_name = 'nekoconnect-db'
-        config = dict(st.secrets['Firestore'])
-        project_name = config['project_id']
-        del config['project_id']
-        credentials = service_account.Credentials.from_service_account_info(config)
-        self.db = firestore.Client(credentials=credentials, database=database_name, project=project_name)
-
+        self.env = env
+        # the client is shared by all sessions, so building a FirestoreDB is cheap
+        self.db = get_firestore_client(env)
+        self.cache = get_read_cache(env)
+        # machines, records and orders are served from snapshot listeners once they are warm
+        self.mirror = get_mirror(env)
+        # local SQLite copy, None unless configured
+        self.replica = get_replica(env)
 
         self.users_collection = self.db.collection('users')
         self.machines_collection = self.db.collection('machines')
         self.records_collection = self.db.collection('records')
         self.income_records_collection = self.db.collection('income_records')
+        self.daily_stats_collection = self.db.collection('daily_stats')
     
     def create_income_record(self, record: IncomeRecord):
-        self.income_records_collection.document(record['date']).set(record)
+        self._write('set', 'income_records', record['date'], record)
 
-    def get_all_income_records(self):
-        return [doc.to_dict() for doc in self.income_records_collection.stream()]
+    def get_all_income_records(self, since: str = None):
+        local = self._local('income_records')
+        if local is not None:
+            return local.select([('date', '>=', since)] if since is not None else [])
+        query = self.income_records_collection
+        if since is not None:
+            query = query.where(filter=FieldFilter('date', '>=', since))
+        return self.cache.get_or_load('income_records', ('all', since), lambda: [doc.to_dict() for doc in query.stream(retry=None)])
 
     def create_user(self, user: User):
-        self.users_collection.document(user.phone_number).set(user.to_dict())
+        self._write('set', 'users', user.phone_number, user.to_dict())
 
     def update_user(self, phone_number: str, updates: Dict[str, Any]):
-        self.users_collection.document(phone_number).update(updates)
+        self._write('update', 'users', phone_number, updates)
 
     def delete_user(self, phone_number: str):
-        self.users_collection.document(phone_number).delete()
+        self._write('delete', 'users', phone_number)
 
     def find_user(self, phone_number: str):
-        doc = self.users_collection.document(phone_number).get()
-        if doc.exists:
-            return User(**doc.to_dict())
+        def load():
+            doc = self.users_collection.document(phone_number).get(retry=None)
+            return doc.to_dict() if doc.exists else None
+        user_dict = self.cache.get_or_load('users', ('doc', phone_number), load)
+        if user_dict is not None:
+            return User(**user_dict)
         return None
 
     def all_users(self):
-        return [User(**doc.to_dict()) for doc in self.users_collection.stream()]
+        user_dicts = self.cache.get_or_load('users', 'all', lambda: [doc.to_dict() for doc in self.users_collection.stream(retry=None)])
+        return [User(**user_dict) for user_dict in user_dicts]
 
     # Machine operations
     def create_machine(self, machine_dict: Dict[str, Any]):
-        self.machines_collection.document(machine_dict['id']).set(machine_dict)
+        self._write('set', 'machines', machine_dict['id'], machine_dict)
 
-    def get_all_machines(self) -> List[Dict[str, Any]]:
-        return [doc.to_dict() for doc in self.machines_collection.stream()]
+    def get_all_machines(self, fields: List[str] = None) -> List[Dict[str, Any]]:
+        local = self._local('machines')
+        if local is not None:
+            return local.select(fields=fields)
+        query = self.machines_collection
+        if fields is not None:
+            query = query.select(fields)
+        key = ('all', tuple(fields) if fields else None)
+        return self.cache.get_or_load('machines', key, lambda: [doc.to_dict() for doc in query.stream(retry=None)])
 
     def get_machine_by_id(self, machine_id: str) -> Dict[str, Any]:
-        doc = self.machines_collection.document(machine_id).get()
-        return doc.to_dict() if doc.exists else None
+        local = self._local('machines')
+        if local is not None:
+            return local.get(machine_id)
+
+        def load():
+            doc = self.machines_collection.document(machine_id).get(retry=None)
+            return doc.to_dict() if doc.exists else None
+        return self.cache.get_or_load('machines', ('doc', machine_id), load)
 
     def update_machine(self, machine_id: str, machine_dict: Dict[str, Any]):
-        self.machines_collection.document(machine_id).set(machine_dict)
+        self._write('set', 'machines', machine_id, machine_dict)
 
     def delete_machine(self, machine_id: str):
-        self.machines_collection.document(machine_id).delete()
+        self._write('delete', 'machines', machine_id)
 
     # Record operations
     def create_record(self, record_dict: Dict[str, Any]):
-        self.records_collection.document(record_dict['id']).set(record_dict)
+        self._write('set', 'records', record_dict['id'], record_dict)
+
+    def get_all_records(self, since: str = None, until: str = None, fields: List[str] = None) -> List[Dict[str, Any]]:
+        filters = []
+        if since is not None:
+            filters.append(('date', '>=', since))
+        if until is not None:
+            filters.append(('date', '<=', until))
+        local = self._local('records')
+        if local is not None:
+            return local.select(filters, fields=fields)
+        query = self._build_query('records', filters, fields=fields)
+        key = ('all', since, until, tuple(fields) if fields else None)
+        return self.cache.get_or_load('records', key, lambda: [doc.to_dict() for doc in query.stream(retry=None)])
 
-    def get_all_records(self) -> List[Dict[str, Any]]:
-        return [doc.to_dict() for doc in self.records_collection.stream()]
+    # Daily stats operations
+    def get_daily_stats(self, since: str = None, until: str = None) -> List[Dict[str, Any]]:
+        filters = []
+        if since is not None:
+            filters.append(('date', '>=', since))
+        if until is not None:
+            filters.append(('date', '<=', until))
+        local = self._local('daily_stats')
+        if local is not None:
+            return local.select(filters)
+        query = self._build_query('daily_stats', filters)
+        return self.cache.get_or_load('daily_stats', ('all', since, until),
+                                      lambda: [doc.to_dict() for doc in query.stream(retry=None)])
 
-    def get_records_by_machine_id(self, machine_id: str) -> List[Dict[str, Any]]:
-        query = self.records_collection.where(
-            filter=FieldFilter('machine_id', '==', machine_id)
-        )
-        return [doc.to_dict() for doc in query.stream()]
+    def get_records_by_machine_id(self, machine_id: str, since: str = None, until: str = None,
+                                  fields: List[str] = None) -> List[Dict[str, Any]]:
+        """A machine's records, newest first, optionally only dates in [since, until] (needs the (machine_id, date) index)"""
+        filters = [('machine_id', '==', machine_id)]
+        if since is not None:
+            filters.append(('date', '>=', since))
+        if until is not None:
+            filters.append(('date', '<=', until))
+        return self.query('records', filters=filters, order_by=('date', 'desc'), fields=fields)
 
     def save_record(self, record_dict: Dict[str, Any]):
-        self.records_collection.document(record_dict['id']).set(record_dict)
+        self._write('set', 'records', record_dict['id'], record_dict)
 
     # Order operations
     def _convert_for_firestore(self, document_dict: Dict[str, Any]) -> Dict[str, Any]:
@@ -100,17 +165,291 @@ class FirestoreDB:
 
     def create_document(self, collection_name: str, document_dict: Dict[str, Any]):
         converted_dict = self._convert_for_firestore(document_dict)
-        self.db.collection(collection_name).document(converted_dict['id']).set(converted_dict)
+        self._write('set', collection_name, converted_dict['id'], converted_dict)
 
     def get_document(self, collection_name: str, document_id: str) -> Dict[str, Any]:
-        doc = self.db.collection(collection_name).document(document_id).get()
-        return doc.to_dict() if doc.exists else None
+        local = self._local(collection_name)
+        if local is not None:
+            return local.get(document_id)
+
+        def load():
+            doc = self.db.collection(collection_name).document(document_id).get(retry=None)
+            return doc.to_dict() if doc.exists else None
+        return self.cache.get_or_load(collection_name, ('doc', document_id), load)
+
+    def get_many(self, collection_name: str, document_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Documents by id fetched in one batched round trip, ids that do not exist are left out"""
+        document_ids = list(dict.fromkeys(document_ids))
+        if not document_ids:
+            return {}
+        local = self._local(collection_name)
+        if local is not None:
+            documents = {document_id: local.get(document_id) for document_id in document_ids}
+            return {document_id: document for document_id, document in documents.items() if document is not None}
+
+        def load():
+            refs = [self.db.collection(collection_name).document(document_id) for document_id in document_ids]
+            return {doc.id: doc.to_dict() for doc in self.db.get_all(refs, retry=None) if doc.exists}
+        return self.cache.get_or_load(collection_name, ('many', tuple(sorted(document_ids))), load)
 
     def update_document(self, collection_name: str, document_id: str, updates: Dict[str, Any]):
-        self.db.collection(collection_name).document(document_id).update(updates)
+        self._write('update', collection_name, document_id, updates)
 
     def delete_document(self, collection_name: str, document_id: str):
-        self.db.collection(collection_name).document(document_id).delete()
+        self._write('delete', collection_name, document_id)
+
+    def _build_query(self, collection_name: str, filters: List[Tuple[str, str, Any]] = None, order_by=None,
+                     limit: int = None, start_after=None, fields: List[str] = None, client=None):
+        """The Firestore query for a query() style read, on client when given (e.g. an AsyncClient)"""
+        query = (client or self.db).collection(collection_name)
+        if fields is not None:
+            query = query.select(fields)
+        for field, op, value in filters or []:
+            query = query.where(filter=FieldFilter(field, op, value))
+        for field, direction in self._normalize_order_by(order_by):
+            query = query.order_by(field, direction=firestore.Query.DESCENDING if direction == 'desc' else firestore.Query.ASCENDING)
+        if start_after is not None:
+            query = query.start_after(start_after)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    def query(self, collection_name: str, filters: List[Tuple[str, str, Any]] = None, order_by=None,
+              limit: int = None, start_after=None, fields: List[str] = None) -> List[Dict[str, Any]]:
+        """
+        Filtered, ordered and limited read evaluated by Firestore.
+        filters: (field, op, value) tuples, e.g. ('plushie_type', 'in', ['small', 'large'])
+        order_by: a field name, a (field, 'asc' | 'desc') tuple, or a list of either
+        start_after: a dict of order_by field values or a document snapshot to continue after
+        fields: only return these fields (a Firestore projection)
+        """
+        if start_after is None:
+            local = self._local(collection_name)
+            rows = local.select(filters, self._normalize_order_by(order_by), limit, fields) if local is not None else None
+            if rows is not None:
+                return rows
+        query = self._build_query(collection_name, filters, order_by, limit, start_after, fields)
+
+        def load():
+            return [doc.to_dict() for doc in query.stream(retry=None)]
+        if start_after is not None and not isinstance(start_after, dict):
+            # snapshots have no stable identity to key the cache on
+            return retry_call('firestore', load)
+        return self.cache.get_or_load(collection_name, self._query_key(filters, order_by, limit, start_after, fields), load)
+
+    def _query_key(self, filters, order_by, limit, start_after, fields):
+        return ('query', repr(filters or []), tuple(self._normalize_order_by(order_by)), limit, repr(start_after),
+                tuple(fields) if fields else None)
+
+    def aggregate(self, collection_name: str, aggregations: List[Tuple[str, str, str]],
+                  filters: List[Tuple[str, str, Any]] = None) -> Dict[str, Any]:
+        """
+        Totals evaluated by Firestore, one aggregation read instead of streaming the documents.
+        aggregations: (kind, field, alias) tuples, kind is 'count', 'sum' or 'avg' (field is ignored for count)
+        Returns {alias: value}; sums over no documents are 0, averages None.
+        """
+        local = self._local(collection_name)
+        rows = local.select(filters) if local is not None else None
+        if rows is not None:
+            return self._aggregate_rows(rows, aggregations)
+
+        def load():
+            results = self._aggregation_query(collection_name, aggregations, filters).get(retry=None)
+            return {result.alias: result.value for result in results[0]}
+        key = ('aggregate', repr(filters or []), tuple(aggregations))
+        return self.cache.get_or_load(collection_name, key, load)
+
+    def _aggregation_query(self, collection_name: str, aggregations: List[Tuple[str, str, str]],
+                           filters: List[Tuple[str, str, Any]] = None) -> AggregationQuery:
+        # collection references and queries both start an AggregationQuery, later aggregations are added to it
+        aggregation_query = self._build_query(collection_name, filters)
+        for kind, field, alias in aggregations:
+            if kind == 'count':
+                aggregation_query = aggregation_query.count(alias=alias)
+            elif kind == 'sum':
+                aggregation_query = aggregation_query.sum(field, alias=alias)
+            elif kind == 'avg':
+                aggregation_query = aggregation_query.avg(field, alias=alias)
+            else:
+                raise ValueError(f"Unknown aggregation: {kind}")
+        return aggregation_query
+
+    @staticmethod
+    def _aggregate_rows(rows: List[Dict[str, Any]], aggregations: List[Tuple[str, str, str]]) -> Dict[str, Any]:
+        """aggregate() evaluated on documents already in memory, numbers only like Firestore"""
+        totals = {}
+        for kind, field, alias in aggregations:
+            if kind == 'count':
+                totals[alias] = len(rows)
+                continue
+            values = [row.get(field) for row in rows]
+            values = [value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+            if kind == 'sum':
+                totals[alias] = sum(values)
+            elif kind == 'avg':
+                totals[alias] = sum(values) / len(values) if values else None
+            else:
+                raise ValueError(f"Unknown aggregation: {kind}")
+        return totals
+
+    def count(self, collection_name: str, filters: List[Tuple[str, str, Any]] = None) -> int:
+        return self.aggregate(collection_name, [('count', None, 'count')], filters)['count']
+
+    def _local(self, collection_name: str):
+        """Where a read can be served without Firestore: the live mirror, else the SQLite replica; None for neither"""
+        mirror = self.mirror.warm(collection_name)
+        if mirror is not None:
+            return mirror
+        if self.replica is not None:
+            return self.replica.collection(collection_name)
+        return None
+
+    @staticmethod
+    def _stamped(data: Dict[str, Any]) -> Dict[str, Any]:
+        return {**data, 'updated_at': firestore.SERVER_TIMESTAMP}
+
+    def _prepared(self, operations: List[Tuple[str, str, str, Dict[str, Any]]]) -> List[Tuple[str, str, str, Dict[str, Any]]]:
+        """
+        Operations as they are written: sets and updates stamped with updated_at,
+        deletes followed by a tombstone so replica syncs see them.
+        """
+        prepared = []
+        for op, collection_name, document_id, data in operations:
+            if op == 'delete':
+                prepared.append((op, collection_name, document_id, None))
+                tombstone = {'collection': collection_name, 'document_id': document_id}
+                prepared.append(('set', DELETIONS_COLLECTION, f"{collection_name}#{document_id}", self._stamped(tombstone)))
+            else:
+                prepared.append((op, collection_name, document_id, self._stamped(data)))
+        return prepared
+
+    def _write(self, op: str, collection_name: str, document_id: str, data: Dict[str, Any] = None):
+        """One document write, a delete is batched with its tombstone"""
+        if op == 'delete':
+            self.write_batch([(op, collection_name, document_id, None)])
+            return
+        ref = self.db.collection(collection_name).document(document_id)
+        data = self._stamped(data)
+        if op == 'set':
+            retry_call('firestore', lambda: ref.set(data, retry=None))
+        elif op == 'update':
+            retry_call('firestore', lambda: ref.update(data, retry=None))
+        else:
+            raise ValueError(f"Unknown write operation: {op}")
+        self._written(collection_name, op, document_id, data)
+
+    def _written(self, collection_name: str, op: str, document_id: str, data: Dict[str, Any] = None):
+        """Drop cached reads of a collection after a write and show the write in the local copies"""
+        self.cache.invalidate(collection_name)
+        self.mirror.apply(collection_name, op, document_id, data)
+        if self.replica is not None:
+            self.replica.apply(collection_name, op, document_id, data)
+
+    def _apply_operation(self, writer, op: str, collection_name: str, document_id: str, data: Dict[str, Any]):
+        """Queue one operation on a WriteBatch or Transaction, they share the same write methods"""
+        ref = self.db.collection(collection_name).document(document_id)
+        if op == 'set':
+            writer.set(ref, data)
+        elif op == 'update':
+            writer.update(ref, data)
+        elif op == 'delete':
+            writer.delete(ref)
+        else:
+            raise ValueError(f"Unknown write operation: {op}")
+
+    def write_batch(self, operations: List[Tuple[str, str, str, Dict[str, Any]]]) -> int:
+        """
+        Apply (op, collection, document_id, data) operations in WriteBatch commits of at most BATCH_LIMIT ops.
+        op is 'set', 'update' or 'delete' (data is ignored for deletes). Returns the number of commits.
+        Each commit is atomic, a failure leaves earlier commits applied: it raises BatchWriteError with
+        the number of operations those commits applied, in the order given.
+        """
+        # a delete and its tombstone go into the same commit
+        groups = [self._prepared([operation]) for operation in operations]
+        chunks, chunk, chunk_size = [], [], 0
+        for group in groups:
+            if chunk and chunk_size + len(group) > BATCH_LIMIT:
+                chunks.append(chunk)
+                chunk, chunk_size = [], 0
+            chunk.append(group)
+            chunk_size += len(group)
+        if chunk:
+            chunks.append(chunk)
+
+        commits = committed = 0
+        collections = set(operation[1] for group in groups for operation in group)
+        try:
+            for chunk in chunks:
+                batch = self.db.batch()
+                prepared = [operation for group in chunk for operation in group]
+                for operation in prepared:
+                    self._apply_operation(batch, *operation)
+                # a batch of sets, updates and deletes can be committed again safely
+                try:
+                    retry_call('firestore', lambda: batch.commit(retry=None))
+                except Exception as e:
+                    raise BatchWriteError(committed, e) from e
+                commits += 1
+                committed += len(chunk)
+                for op, collection_name, document_id, data in prepared:
+                    self._written(collection_name, op, document_id, data)
+        finally:
+            for collection_name in collections:
+                self.cache.invalidate(collection_name)
+        return commits
+
+    def run_transaction(self, reads: List[Dict[str, Any]], build_operations: Callable[[List[List[Dict[str, Any]]]], List[Tuple]]):
+        """
+        Read, then write atomically. reads are query() keyword dicts evaluated inside the transaction;
+        build_operations gets their results and returns write_batch-style operations.
+        Firestore re-runs the whole function when a read document changed before the commit.
+        Returns the operations that were committed.
+        """
+        written = set()
+
+        @firestore.transactional
+        def run(transaction):
+            results = [[doc.to_dict() for doc in transaction.get(self._build_query(**read))] for read in reads]
+            operations = self._prepared(build_operations(results))
+            for operation in operations:
+                written.add(operation[1])
+                self._apply_operation(transaction, *operation)
+            return operations
+
+        try:
+            operations = run(self.db.transaction())
+            for op, collection_name, document_id, data in operations:
+                self._written(collection_name, op, document_id, data)
+            return operations
+        finally:
+            for collection_name in written:
+                self.cache.invalidate(collection_name)
+
+    def get_page(self, collection_name: str, page_size: int, order_by, start_after=None,
+                 filters: List[Tuple[str, str, Any]] = None, fields: List[str] = None):
+        """
+        One page of a query, returned as (documents, cursor).
+        cursor is the last document snapshot, pass it back as start_after for the next page; None on the last page.
+        """
+        query = self._build_query(collection_name, filters, order_by, page_size, start_after, fields)
+        snapshots = retry_call('firestore', lambda: list(query.stream(retry=None)))
+        cursor = snapshots[-1] if len(snapshots) == page_size else None
+        return [doc.to_dict() for doc in snapshots], cursor
+
+    @staticmethod
+    def _normalize_order_by(order_by) -> List[Tuple[str, str]]:
+        if order_by is None:
+            return []
+        if isinstance(order_by, (str, tuple)):
+            order_by = [order_by]
+        return [(item, 'asc') if isinstance(item, str) else tuple(item) for item in order_by]
 
-    def get_collection(self, collection_name: str) -> List[Dict[str, Any]]:
-        return [doc.to_dict() for doc in self.db.collection(collection_name).stream()]
+    def get_collection(self, collection_name: str, fields: List[str] = None) -> List[Dict[str, Any]]:
+        local = self._local(collection_name)
+        if local is not None:
+            return local.select(fields=fields)
+        query = self.db.collection(collection_name)
+        if fields is not None:
+            query = query.select(fields)
+        key = ('all', tuple(fields) if fields else None)
+        return self.cache.get_or_load(collection_name, key, lambda: [doc.to_dict() for doc in query.stream(retry=None)])
@@ -0,0 +1,76 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.cloud import firestore
+
+# filter operators that can be evaluated on documents held locally, other queries go to Firestore
+comparisons = {
+    '==': lambda value, target: value == target,
+    '!=': lambda value, target: value is not None and value != target,
+    '<': lambda value, target: value < target,
+    '<=': lambda value, target: value <= target,
+    '>': lambda value, target: value > target,
+    '>=': lambda value, target: value >= target,
+    'in': lambda value, target: value in target,
+}
+
+
+def normalize(value):
+    """A written value as Firestore will return it"""
+    if value is firestore.SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    # Firestore stores naive datetimes as UTC and returns them timezone-aware
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def normalize_document(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: normalize(value) for key, value in data.items()}
+
+
+def supports(filters: List[Tuple[str, str, Any]] = None) -> bool:
+    return all(op in comparisons for _, op, _ in filters or [])
+
+
+def matches(document: Dict[str, Any], filters: List[Tuple[str, str, Any]]) -> bool:
+    for field, op, target in filters:
+        if field not in document:
+            return False
+        try:
+            if not comparisons[op](document[field], normalize(target)):
+                return False
+        except TypeError:
+            # Firestore only compares values of the same type
+            return False
+    return True
+
+
+def _order_key(value):
+    return (0, 0) if value is None else (1, value)
+
+
+def evaluate(documents: List[Dict[str, Any]], filters: List[Tuple[str, str, Any]] = None,
+             order_by: List[Tuple[str, str]] = None, limit: int = None,
+             fields: List[str] = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    A query() style read evaluated on documents in memory, with Firestore's semantics.
+    Returns new dicts, None when the query cannot be evaluated locally.
+    """
+    if not supports(filters):
+        return None
+    documents = [document for document in documents if matches(document, filters or [])]
+    try:
+        for field, direction in reversed(order_by or []):
+            # like Firestore, ordering by a field drops documents without it and puts nulls first
+            documents = [document for document in documents if field in document]
+            documents.sort(key=lambda document: _order_key(document[field]), reverse=direction == 'desc')
+    except TypeError:
+        # mixed value types, let Firestore order them
+        return None
+    if limit is not None:
+        documents = documents[:limit]
+    if fields is not None:
+        return [{field: document[field] for field in fields if field in document} for document in documents]
+    # callers mutate what they get back, the values themselves are not shared containers
+    return [dict(document) for document in documents]
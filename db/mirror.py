@@ -0,0 +1,118 @@
+import threading
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import streamlit as st
+from google.cloud.firestore_v1.watch import ChangeType
+
+from db.client_registry import get_firestore_client
+from db.local_query import evaluate, normalize_document
+
+logger = logging.getLogger(__name__)
+
+# reference data read by almost every page, kept in memory by snapshot listeners
+MIRRORED_COLLECTIONS = ['machines', 'records', 'orders']
+
+
+class CollectionMirror:
+    """
+    In-memory copy of one collection, kept up to date by an on_snapshot listener.
+    The first snapshot delivers every document, later ones only the changes.
+    """
+    def __init__(self, collection_ref):
+        self.collection_ref = collection_ref
+        self.lock = threading.Lock()
+        self.documents = {}
+        self.ready = threading.Event()
+        self.watch = None
+
+    def start(self):
+        with self.lock:
+            self.documents = {}
+            self.ready.clear()
+        self.watch = self.collection_ref.on_snapshot(self._on_snapshot)
+
+    def _on_snapshot(self, snapshots, changes, read_time):
+        with self.lock:
+            for change in changes:
+                if change.type == ChangeType.REMOVED:
+                    self.documents.pop(change.document.id, None)
+                else:
+                    self.documents[change.document.id] = change.document.to_dict()
+        self.ready.set()
+
+    def ensure_running(self):
+        """Resubscribe when the listener died, e.g. after a network error"""
+        if self.watch is None or not self.watch.is_active:
+            logger.warning(f"Restarting snapshot listener for {self.collection_ref.id}")
+            if self.watch is not None:
+                self.watch.unsubscribe()
+            self.start()
+
+    def is_warm(self) -> bool:
+        return self.ready.is_set() and self.watch is not None and self.watch.is_active
+
+    def apply(self, op: str, document_id: str, data: Dict[str, Any]):
+        """Apply a write made by this process right away, the listener confirms it shortly after"""
+        with self.lock:
+            if op == 'delete':
+                self.documents.pop(document_id, None)
+            elif op == 'set':
+                self.documents[document_id] = normalize_document(data)
+            elif op == 'update' and document_id in self.documents:
+                # replaced, not mutated, so readers outside the lock see one version or the other
+                self.documents[document_id] = {**self.documents[document_id], **normalize_document(data)}
+
+    def get(self, document_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            document = self.documents.get(document_id)
+            return dict(document) if document is not None else None
+
+    def select(self, filters: List[Tuple[str, str, Any]] = None, order_by: List[Tuple[str, str]] = None,
+               limit: int = None, fields: List[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """Documents matching a query() style read, None when the mirror cannot evaluate it"""
+        with self.lock:
+            documents = list(self.documents.values())
+        return evaluate(documents, filters, order_by, limit, fields)
+
+
+class Mirror:
+    """Snapshot-listener mirrors of MIRRORED_COLLECTIONS for one env, started on first use"""
+    def __init__(self, env):
+        self.env = env
+        self.lock = threading.Lock()
+        self.collections = {}
+
+    def _collection(self, collection_name: str) -> Optional[CollectionMirror]:
+        if collection_name not in MIRRORED_COLLECTIONS:
+            return None
+        with self.lock:
+            mirror = self.collections.get(collection_name)
+            if mirror is None:
+                mirror = CollectionMirror(get_firestore_client(self.env).collection(collection_name))
+                self.collections[collection_name] = mirror
+                mirror.start()
+            else:
+                mirror.ensure_running()
+        return mirror
+
+    def warm(self, collection_name: str) -> Optional[CollectionMirror]:
+        """The collection's mirror if it can serve reads, None until its first snapshot arrived"""
+        try:
+            mirror = self._collection(collection_name)
+        except Exception as e:
+            logger.warning(f"Could not start snapshot listener for {collection_name}: {e}")
+            return None
+        if mirror is None or not mirror.is_warm():
+            return None
+        return mirror
+
+    def apply(self, collection_name: str, op: str, document_id: str, data: Dict[str, Any]):
+        mirror = self.collections.get(collection_name)
+        if mirror is not None:
+            mirror.apply(op, document_id, data)
+
+
+@st.cache_resource
+def get_mirror(env):
+    return Mirror(env)
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import streamlit as st
+from google.cloud.firestore import FieldFilter
+
+from db.client_registry import get_firestore_client
+from db.local_query import evaluate, normalize_document, supports
+
+logger = logging.getLogger(__name__)
+
+REPLICATED_COLLECTIONS = ['machines', 'records', 'orders', 'income_records', 'daily_stats']
+# pulled out of the documents into indexed columns, filters on them are evaluated by SQLite
+INDEXED_FIELDS = ['machine_id', 'date', 'status', 'plushie_type']
+# FirestoreDB records a tombstone here for every delete, a watermark query cannot see deleted documents
+DELETIONS_COLLECTION = 'deletions'
+# seconds between incremental syncs of a collection triggered by reads
+SYNC_INTERVAL = 30
+# server timestamps are assigned at commit, so a write can become visible after a later one was synced
+SYNC_OVERLAP = timedelta(seconds=60)
+
+_sql_ops = {'==': '=', '<': '<', '<=': '<=', '>': '>', '>=': '>=', 'in': 'IN'}
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f"Cannot store {type(value).__name__} in the replica")
+
+
+def _decode(obj):
+    if '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    return obj
+
+
+def _is_simple(value) -> bool:
+    return isinstance(value, (str, int, float)) and not isinstance(value, bool)
+
+
+def _timestamp(value) -> Optional[float]:
+    return value.timestamp() if isinstance(value, datetime) else None
+
+
+class Replica:
+    """
+    SQLite copy of REPLICATED_COLLECTIONS, one table per collection holding the documents as JSON.
+    sync() pulls only the documents whose updated_at is past the collection's stored watermark,
+    plus the tombstones of documents deleted since the last sync.
+    """
+    def __init__(self, env, path: str):
+        self.env = env
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.last_synced = {}
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self._create_tables()
+
+    def _create_tables(self):
+        columns = ', '.join(INDEXED_FIELDS)
+        with self.lock, self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS watermarks (collection TEXT PRIMARY KEY, documents TEXT, deletions TEXT)')
+            for collection_name in REPLICATED_COLLECTIONS:
+                self.conn.execute(f'CREATE TABLE IF NOT EXISTS {collection_name} '
+                                  f'(id TEXT PRIMARY KEY, {columns}, updated_at REAL, data TEXT NOT NULL)')
+                for field in INDEXED_FIELDS:
+                    self.conn.execute(f'CREATE INDEX IF NOT EXISTS {collection_name}_{field} ON {collection_name} ({field})')
+
+    @staticmethod
+    def _row(document_id: str, data: Dict[str, Any]) -> Tuple:
+        indexed = [data.get(field) if _is_simple(data.get(field)) else None for field in INDEXED_FIELDS]
+        return (document_id, *indexed, _timestamp(data.get('updated_at')), json.dumps(data, default=_encode))
+
+    def _upsert(self, collection_name: str, rows: List[Tuple]):
+        placeholders = ', '.join('?' * (len(INDEXED_FIELDS) + 3))
+        self.conn.executemany(f'INSERT OR REPLACE INTO {collection_name} VALUES ({placeholders})', rows)
+
+    def _watermarks(self, collection_name: str) -> Tuple[Optional[datetime], Optional[datetime]]:
+        with self.lock:
+            row = self.conn.execute('SELECT documents, deletions FROM watermarks WHERE collection = ?',
+                                    (collection_name,)).fetchone()
+        if row is None:
+            return None, None
+        return tuple(datetime.fromisoformat(mark) if mark else None for mark in row)
+
+    # Reads
+    def get(self, collection_name: str, document_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute(f'SELECT data FROM {collection_name} WHERE id = ?', (document_id,)).fetchone()
+        return json.loads(row[0], object_hook=_decode) if row is not None else None
+
+    def select(self, collection_name: str, filters: List[Tuple[str, str, Any]] = None,
+               order_by: List[Tuple[str, str]] = None, limit: int = None,
+               fields: List[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """A query() style read, None when it cannot be evaluated locally"""
+        if not supports(filters):
+            return None
+        # indexed columns narrow the rows down in SQL, every filter is still checked on the documents
+        clauses, params = [], []
+        for field, op, target in filters or []:
+            if field not in INDEXED_FIELDS or op not in _sql_ops:
+                continue
+            if op == 'in' and all(_is_simple(value) for value in target):
+                clauses.append(f"{field} IN ({', '.join('?' * len(target))})")
+                params.extend(target)
+            elif op != 'in' and _is_simple(target):
+                clauses.append(f'{field} {_sql_ops[op]} ?')
+                params.append(target)
+        sql = f'SELECT data FROM {collection_name}'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        documents = [json.loads(row[0], object_hook=_decode) for row in rows]
+        return evaluate(documents, filters, order_by, limit, fields)
+
+    # Writes made by this process, the next sync replaces them with what Firestore stored
+    def apply(self, collection_name: str, op: str, document_id: str, data: Dict[str, Any]):
+        if collection_name not in REPLICATED_COLLECTIONS:
+            return
+        if op == 'update':
+            document = self.get(collection_name, document_id)
+            if document is None:
+                return
+            data = {**document, **data}
+        with self.lock, self.conn:
+            if op == 'delete':
+                self.conn.execute(f'DELETE FROM {collection_name} WHERE id = ?', (document_id,))
+            else:
+                self._upsert(collection_name, [self._row(document_id, normalize_document(data))])
+
+    # Sync
+    def sync(self, collection_name: str) -> int:
+        """Pull the changes of a collection since its watermark, a full copy on the first sync. Returns the number of changes."""
+        with self.sync_lock:
+            client = get_firestore_client(self.env)
+            documents_mark, deletions_mark = self._watermarks(collection_name)
+            full = documents_mark is None
+            started = datetime.now(timezone.utc)
+
+            query = client.collection(collection_name)
+            if not full:
+                query = query.where(filter=FieldFilter('updated_at', '>', documents_mark - SYNC_OVERLAP))
+            rows = [self._row(doc.id, doc.to_dict()) for doc in query.stream()]
+            stamped = [row[-2] for row in rows if row[-2] is not None]
+            if stamped:
+                newest = datetime.fromtimestamp(max(stamped), timezone.utc)
+                documents_mark = newest if full else max(documents_mark, newest)
+            elif full:
+                # nothing is stamped yet, everything up to now has been copied
+                documents_mark = started - SYNC_OVERLAP
+
+            deletions = []
+            if full:
+                # a full copy has nothing to delete, only later deletions matter
+                deletions_mark = started - SYNC_OVERLAP
+            else:
+                query = (client.collection(DELETIONS_COLLECTION)
+                         .where(filter=FieldFilter('collection', '==', collection_name))
+                         .where(filter=FieldFilter('updated_at', '>', deletions_mark - SYNC_OVERLAP)))
+                for doc in query.stream():
+                    tombstone = doc.to_dict()
+                    deletions.append((tombstone['document_id'], _timestamp(tombstone['updated_at'])))
+                    deletions_mark = max(deletions_mark, tombstone['updated_at'])
+
+            with self.lock, self.conn:
+                if full:
+                    self.conn.execute(f'DELETE FROM {collection_name}')
+                self._upsert(collection_name, rows)
+                # a document recreated after its deletion keeps its newer version
+                self.conn.executemany(f'DELETE FROM {collection_name} WHERE id = ? AND (updated_at IS NULL OR updated_at <= ?)',
+                                      deletions)
+                self.conn.execute('INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?)',
+                                  (collection_name, documents_mark.isoformat(), deletions_mark.isoformat()))
+            self.last_synced[collection_name] = time.monotonic()
+            logger.info(f"Synced {len(rows)} changed and {len(deletions)} deleted {collection_name} documents into the replica")
+            return len(rows) + len(deletions)
+
+    def sync_all(self) -> int:
+        return sum(self.sync(collection_name) for collection_name in REPLICATED_COLLECTIONS)
+
+    def collection(self, collection_name: str) -> Optional['ReplicaCollection']:
+        """A view of the collection for serving reads, synced at most every SYNC_INTERVAL seconds; None if it has never synced"""
+        if collection_name not in REPLICATED_COLLECTIONS:
+            return None
+        last_synced = self.last_synced.get(collection_name)
+        if last_synced is None or time.monotonic() - last_synced > SYNC_INTERVAL:
+            try:
+                self.sync(collection_name)
+            except Exception as e:
+                logger.warning(f"Replica sync of {collection_name} failed: {e}")
+                if self._watermarks(collection_name)[0] is None:
+                    return None
+        return ReplicaCollection(self, collection_name)
+
+
+class ReplicaCollection:
+    """One replicated collection, read like a snapshot-listener mirror"""
+    def __init__(self, replica: Replica, collection_name: str):
+        self.replica = replica
+        self.collection_name = collection_name
+
+    def get(self, document_id: str) -> Optional[Dict[str, Any]]:
+        return self.replica.get(self.collection_name, document_id)
+
+    def select(self, filters: List[Tuple[str, str, Any]] = None, order_by: List[Tuple[str, str]] = None,
+               limit: int = None, fields: List[str] = None) -> Optional[List[Dict[str, Any]]]:
+        return self.replica.select(self.collection_name, filters, order_by, limit, fields)
+
+
+@st.cache_resource
+def get_replica(env) -> Optional[Replica]:
+    """The env's replica, None unless REPLICA_DIR is set in the ENV secrets"""
+    replica_dir = st.secrets['ENV'].get('REPLICA_DIR')
+    if not replica_dir:
+        return None
+    os.makedirs(replica_dir, exist_ok=True)
+    return Replica(env, os.path.join(replica_dir, f'replica_{env}.sqlite'))
@@ -0,0 +1,138 @@
+import time
+import random
+import threading
+import logging
+from collections import Counter
+from typing import Any, Callable, Dict, Hashable
+
+import streamlit as st
+from google.api_core import exceptions as api_exceptions
+
+logger = logging.getLogger(__name__)
+
+# transient Firestore errors, the client library raises these for gRPC UNAVAILABLE, DEADLINE_EXCEEDED, ...
+RETRIABLE_ERRORS = (
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.InternalServerError,
+    api_exceptions.TooManyRequests,
+    api_exceptions.ResourceExhausted,
+    api_exceptions.Aborted,
+    ConnectionError,
+    TimeoutError,
+)
+# transient HTTP statuses, GCS errors from gcsfs carry them as .code
+RETRIABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+# seconds: first backoff, backoff cap, and the total time a call may spend retrying
+INITIAL_BACKOFF = 0.2
+MAX_BACKOFF = 5.0
+DEFAULT_DEADLINE = 30.0
+# seconds between logged snapshots of the resilience metrics
+METRICS_LOG_INTERVAL = 300
+
+
+def is_retriable(error: BaseException) -> bool:
+    if isinstance(error, RETRIABLE_ERRORS):
+        return True
+    return getattr(error, 'code', None) in RETRIABLE_STATUS_CODES
+
+
+class ResilienceMetrics:
+    """
+    Counts of coalesced, retried and failed calls, by backend ('firestore', 'blob').
+    The totals are logged on the first event and then at most every METRICS_LOG_INTERVAL seconds.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.last_logged = None
+
+    def increment(self, backend: str, event: str):
+        with self.lock:
+            self.counters[(backend, event)] += 1
+            now = time.monotonic()
+            due = self.last_logged is None or now - self.last_logged >= METRICS_LOG_INTERVAL
+            if due:
+                self.last_logged = now
+        if due:
+            logger.info(f"Resilience metrics: {self.snapshot()}")
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            return {f"{backend}.{event}": count for (backend, event), count in sorted(self.counters.items())}
+
+
+@st.cache_resource
+def get_resilience_metrics():
+    return ResilienceMetrics()
+
+
+def retry_call(backend: str, func: Callable[[], Any], deadline: float = DEFAULT_DEADLINE) -> Any:
+    """
+    Call func, retrying retriable errors with full-jitter exponential backoff until deadline seconds have passed.
+    Other errors, and the last retriable one, are raised.
+    Client calls in func should pass retry=None, their own retries would run past the deadline.
+    """
+    start = time.monotonic()
+    backoff = INITIAL_BACKOFF
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            delay = random.uniform(0, backoff)
+            if not is_retriable(e) or time.monotonic() - start + delay > deadline:
+                if is_retriable(e):
+                    get_resilience_metrics().increment(backend, 'gave_up')
+                raise
+            get_resilience_metrics().increment(backend, 'retried')
+            logger.warning(f"Retrying {backend} call in {delay:.2f}s after {type(e).__name__}: {e}")
+            time.sleep(delay)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Singleflight:
+    """
+    Concurrent calls with the same key share one execution: the first caller runs func,
+    the others wait for it and get the same result or exception.
+    """
+    def __init__(self, backend: str):
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.calls[key] = call
+        if not leader:
+            get_resilience_metrics().increment(self.backend, 'coalesced')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+
+@st.cache_resource
+def get_singleflight(backend: str):
+    return Singleflight(backend)
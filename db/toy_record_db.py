@@ -10,6 +10,8 @@ from tinydb import TinyDB, Query
 from tinydb.storages import MemoryStorage
 from st_files_connection import FilesConnection
 
+from db.resilience import get_singleflight, retry_call
+
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -28,17 +30,27 @@ class BlobDB:
         self.conn = st.connection('gcs', type=FilesConnection)
         assert self.env in db_path, "Invalid environment"
         self.current_db_path = db_path[self.env]
-        db_dict = self.conn.read(self.current_db_path, input_format="json", ttl=0)
-        self.db = TinyDB(storage=MemoryStorage)
-        self.db.storage.read = lambda: db_dict
-        self.users_table = self.db.table('users')
+        self._db = None
+
+    @property
+    def db(self):
+        # the legacy TinyDB snapshot is only downloaded when a caller actually uses it
+        if self._db is None:
+            db_dict = retry_call('blob', lambda: self.conn.read(self.current_db_path, input_format="json", ttl=0))
+            self._db = TinyDB(storage=MemoryStorage)
+            self._db.storage.read = lambda: db_dict
+        return self._db
+
+    @property
+    def users_table(self):
+        return self.db.table('users')
 
     def table(self, table_name):
         return self.db.table(table_name)
 
     def delete_file(self, path):
         full_path = f"{self.bucket}/{path}"
-        self.conn._instance.delete(full_path)
+        retry_call('blob', lambda: self.conn._instance.delete(full_path))
 
     def save(self):
         # Convert the current database to a JSON string
@@ -63,14 +75,33 @@ class BlobDB:
             os.unlink(temp_file.name)
             
     def download_all_data(self):
-        db_dict = self.conn.read(self.current_db_path, input_format="json", ttl=0)
+        db_dict = retry_call('blob', lambda: self.conn.read(self.current_db_path, input_format="json", ttl=0))
         return db_dict
 
     def download_file(self, path):
         full_path = f"{self.bucket}/{path}"
-        with self.conn._instance.open(full_path, 'rb') as f:
-            content = f.read()
-            return content
+
+        def download():
+            with self.conn._instance.open(full_path, 'rb') as f:
+                return f.read()
+        # sessions opening the same page at once download each file once
+        return get_singleflight('blob').do(('download', full_path), lambda: retry_call('blob', download))
+
+    def file_exists(self, path):
+        full_path = f"{self.bucket}/{path}"
+        return get_singleflight('blob').do(('exists', full_path), lambda: retry_call('blob', lambda: self.conn._instance.exists(full_path)))
+
+    def upload_bytes(self, data: bytes, path: str):
+        full_path = f"{self.bucket}/{path}"
+        with tempfile.NamedTemporaryFile(mode='wb', delete=False) as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+
+        try:
+            logging.info(f"Uploading {len(data)} bytes to {path}")
+            retry_call('blob', lambda: self.conn._instance.put(temp_file.name, full_path))
+        finally:
+            os.unlink(temp_file.name)
 
     def upload_file(self, file: io.BytesIO, path: str, compress: bool = False):
         full_path = f"{self.bucket}/{path}"
@@ -117,7 +148,7 @@ class BlobDB:
             # Use put method to upload the temporary file
             logging.info(f"Uploading file to {path}")
             logging.info(f"File: {temp_file.name}")
-            self.conn._instance.put(temp_file.name, full_path)
+            retry_call('blob', lambda: self.conn._instance.put(temp_file.name, full_path))
         finally:
             # Clean up the temporary file
             os.unlink(temp_file.name)
\ No newline at end of file
@@ -15,6 +15,8 @@ st.set_page_config(
 
 # Local application imports
 from backend.user_mgr import Manager
+from backend.pagination import get_paginator, reset_paginator
+from backend.warmup import get_warmup
 from app_pages.edit_user import app as edit_user_page
 from app_pages.add_new_user import app as add_new_user_page
 from app_pages.calculator import app as calculator_page
@@ -23,13 +25,15 @@ from app_pages.record import app as record_page
 from app_pages.record_analyze import app as record_analyze_page
 from app_pages.edit_machine import app as edit_machine_page
 from app_pages.leaderboard import app as leaderboard_page
-from app_pages.dashboard import app as dashboard_page
+from app_pages.dashboard import app as dashboard_page, records_since
 from app_pages.add_order import app as add_order_page
 from app_pages.order_status import app as order_status_page
 from app_pages.edit_order import app as edit_order_page
 
 logging.basicConfig(level=logging.INFO)
 
+USERS_PAGE_SIZE = 50
+
 
 st_secrets = dict(st.secrets)
 credentials = st.secrets["credentials"].to_dict()
@@ -58,6 +62,10 @@ if authentication_status:
     
     mgr = Manager(env)
 
+    # prefetch what the pages read first while the user is still looking at this one
+    warmup = get_warmup(env)
+    warmup.start(records_since())
+
     # init session state
     if 'selected_user' not in st.session_state:
         st.session_state['selected_user'] = None
@@ -81,6 +89,25 @@ if authentication_status:
     st.sidebar.button("Add Order", on_click=switch_page, args=('add_order',), use_container_width=True)
     st.sidebar.button("Order Status", on_click=switch_page, args=('order_status',), use_container_width=True)
 
+    # refreshed every second only while the warm-up is still running; run_every is fixed until the
+    # next full run, so the fragment ends its own polling with one full rerun once the warm-up is done
+    polling = warmup.done < len(warmup.STEPS)
+
+    @st.fragment(run_every=1 if polling else None)
+    def warmup_progress():
+        done, total = warmup.done, len(warmup.STEPS)
+        if polling and done == total:
+            st.rerun(scope="app")
+        if done < total:
+            st.progress(done / total, text=f"Loading data ({done}/{total})")
+        else:
+            failed = [step for step, status in warmup.status.items() if status == 'failed']
+            if failed:
+                st.caption(f"Could not preload: {', '.join(failed)}")
+
+    with st.sidebar:
+        warmup_progress()
+
 
     def home_page():
         # Page functionality
@@ -99,13 +126,12 @@ if authentication_status:
                     authenticator.logout('Logout', 'main')
         st.markdown("---")
         st.markdown("### All Users")
+        totals = mgr.get_user_totals()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Users", totals['users'])
+        col2.metric("Outstanding credits", totals['credits'])
+        col3.metric("Outstanding tokens", totals['tokens'])
 
-        # find all users
-        all_info = mgr.display_user_info()
-        if all_info is None:
-            st.info("No users found. Please add a new user.")
-            return
-        
         # search bar
         col1, col2 = st.columns([3, 1])
         with col1:
@@ -113,14 +139,25 @@ if authentication_status:
         with col2:
             if st.button("Clear", use_container_width=True):
                 search_phone = ""
+
         if search_phone:
-            all_info = all_info[all_info['phone_number'].str.contains(search_phone, case=False, na=False)]
-            all_info = all_info.reset_index(drop=True)
+            # searching matches anywhere in the phone number, so it needs every user
+            all_info = mgr.display_user_info()
+            if all_info is not None:
+                all_info = all_info[all_info['phone_number'].str.contains(search_phone, case=False, na=False)]
+                all_info = all_info.reset_index(drop=True)
+        else:
+            # otherwise users are loaded a page at a time
+            paginator = get_paginator('users_paginator', lambda cursor: mgr.get_users_page(USERS_PAGE_SIZE, cursor))
+            all_info = pd.DataFrame(paginator.items, columns=['phone_number', 'name', 'credits', 'tokens']) if paginator.items else None
+        if all_info is None:
+            st.info("No users found. Please add a new user.")
+            return
         
         st.markdown("---")
         col1, col2, col3 = st.columns([1, 1, 5])
         with col1:
-            st.button('Refresh')
+            st.button('Refresh', on_click=reset_paginator, args=('users_paginator',))
         with col2:
             db_json = mgr.download_all_data()
             st.download_button(
@@ -133,12 +170,14 @@ if authentication_status:
         def on_edit_click(index):
             st.session_state['selected_user'] = all_info.iloc[index]
             st.session_state['page'] = 'edit_user'
+            reset_paginator('users_paginator')
 
 
         def on_delete_click(index):
             # double check to confirm deletion
             phone_number = all_info.iloc[index]['phone_number']
             mgr.delete_user(phone_number)
+            reset_paginator('users_paginator')
 
         for index, row in all_info.iterrows():
             col1, col2, col3 = st.columns([5, 1, 1])
@@ -150,6 +189,9 @@ if authentication_status:
             with col3:
                 st.button("Delete", key=f"delete_{index}", use_container_width=True, on_click=on_delete_click, args=(index,))
 
+        if not search_phone and not paginator.done:
+            st.button("Load more", on_click=paginator.load_next)
+
 
     if st.session_state['page'] == 'home':
         dashboard_page()
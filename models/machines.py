@@ -30,6 +30,7 @@ class Machine:
     id: str = None
     notes: Optional[str] = None
     image: Optional[str] = None   # path to image
+    updated_at: Optional[datetime] = None   # set by Firestore on every write
 
     def get_params(self):
         """Summary of the machine parameters"""
@@ -45,4 +46,17 @@ class IncomeRecord:
     auto_machine: int
     total: int
     date: str = field(default_factory=lambda: datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-    
\ No newline at end of file
+
+@dataclass
+class DailyStat:
+    """Per-machine daily delta, the sum of the day's differenced meter readings"""
+    machine_id: str
+    date: str   # %Y-%m-%d
+    coins_in: int
+    toys_payout: int
+    payout_rate: float
+    id: str = None
+
+    def __post_init__(self):
+        if self.id is None:
+            self.id = f"{self.date}#{self.machine_id}"
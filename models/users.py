@@ -1,5 +1,6 @@
 from dataclasses import dataclass, asdict
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 
 @dataclass
 class Redemption:
@@ -18,6 +19,7 @@ class User:
     name: str = ""
     notes: str = ""
     redemption_history: List[Redemption] = None
+    updated_at: Optional[datetime] = None   # set by Firestore on every write
     
     def __post_init__(self):
         if self.redemption_history is None:
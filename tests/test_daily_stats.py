@@ -0,0 +1,58 @@
+import pandas as pd
+
+from backend.rolling import RollingMetrics
+from backend.toy_record_mgr import Manager
+from models.machines import Record
+
+STORED = [
+    {'id': '1', 'machine_id': 'a', 'date': '2024-01-01 10:00:00', 'coins_in': 100, 'toys_payout': 1},
+    {'id': '2', 'machine_id': 'a', 'date': '2024-01-02 09:00:00', 'coins_in': 150, 'toys_payout': 2},
+    {'id': '3', 'machine_id': 'a', 'date': '2024-01-03 09:00:00', 'coins_in': 200, 'toys_payout': 4},
+]
+
+
+def make_manager(neighbours):
+    # the one records read and the neighbour fallback are served from STORED, nothing is sent to Firestore
+    manager = Manager.__new__(Manager)
+    manager.get_all_records_df = lambda since=None, until=None, fields=None: pd.DataFrame(
+        [record for record in STORED if record['date'] >= since], columns=fields)
+    manager.get_neighbour_record = lambda machine_id, date, before=True: neighbours.append(machine_id)
+    return manager
+
+
+def record(**values):
+    return Record(param_strong_strength=1.0, param_medium_strength=1.0, param_weak_strength=1.0,
+                  param_award_interval=10, **values)
+
+
+def test_a_reading_updates_its_day_and_the_next_reading_day():
+    neighbours = []
+    stats = make_manager(neighbours).daily_stats_for_records([
+        record(id='4', machine_id='a', date='2024-01-02 18:00:00', coins_in=170, toys_payout=3),
+    ])
+    assert [(stat.id, stat.coins_in, stat.toys_payout) for stat in stats] == [
+        ('2024-01-02#a', 70, 2), ('2024-01-03#a', 30, 1)]
+    assert neighbours == []
+
+
+def test_only_machines_without_an_earlier_reading_need_the_neighbour_query():
+    neighbours = []
+    stats = make_manager(neighbours).daily_stats_for_records([
+        record(id='5', machine_id='b', date='2024-01-02 18:00:00', coins_in=10, toys_payout=1),
+    ])
+    assert [(stat.id, stat.coins_in, stat.toys_payout) for stat in stats] == [('2024-01-02#b', 0, 0)]
+    assert neighbours == ['b']
+
+
+def test_rolling_metrics_from_daily_stats():
+    stats = pd.DataFrame({
+        'machine_id': ['a', 'a', 'b', 'b'],
+        'date': ['2024-01-01', '2024-01-03', '2024-01-03', '2023-12-31'],
+        'coins_in': [50, 30, 20, 99],
+        'toys_payout': [1, 1, 2, 9],
+    })
+    metrics = RollingMetrics.from_daily_stats(stats, '2024-01-01', '2024-01-04')
+    assert metrics.machine_window('a', 2) == (30, 1, 30.0)
+    assert metrics.machine_window('a') == (80, 2, 40.0)
+    assert metrics.fleet_window(1) == (0, 0, 0.0)
+    assert metrics.fleet_window(4)[:2] == (100, 4)
@@ -0,0 +1,27 @@
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import firestore
+
+from db.firestore import FirestoreDB
+
+
+def make_db():
+    # only the query building is exercised, nothing is sent to Firestore
+    db = FirestoreDB.__new__(FirestoreDB)
+    db.db = firestore.Client(project='test', credentials=AnonymousCredentials())
+    return db
+
+
+def test_aggregation_query_without_filters():
+    aggregation_query = make_db()._aggregation_query('users', [
+        ('count', None, 'users'),
+        ('sum', 'credits', 'credits'),
+    ])
+    request = aggregation_query._to_protobuf()
+    assert [aggregation.alias for aggregation in request.aggregations] == ['users', 'credits']
+
+
+def test_aggregation_query_with_filters():
+    aggregation_query = make_db()._aggregation_query('orders', [('sum', 'amount', 'amount')],
+                                                     filters=[('plushie_type', '==', 'small')])
+    request = aggregation_query._to_protobuf()
+    assert request.structured_query.where.field_filter.field.field_path == 'plushie_type'
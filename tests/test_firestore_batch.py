@@ -0,0 +1,66 @@
+import pytest
+from google.api_core import exceptions as api_exceptions
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import firestore
+
+from db import firestore as firestore_module
+from db.cache import ReadCache
+from db.firestore import BatchWriteError, FirestoreDB
+from db.mirror import Mirror
+
+
+class FakeBatch:
+    def __init__(self, client):
+        self.client = client
+        self.operations = 0
+
+    def set(self, ref, data):
+        self.operations += 1
+
+    def update(self, ref, data):
+        self.operations += 1
+
+    def delete(self, ref):
+        self.operations += 1
+
+    def commit(self, retry=None):
+        if len(self.client.committed) == self.client.fail_at:
+            raise api_exceptions.InvalidArgument('rejected')
+        self.client.committed.append(self.operations)
+
+
+class FakeClient(firestore.Client):
+    """Builds real document references, records commits instead of sending them"""
+    def __init__(self, fail_at=None):
+        super().__init__(project='test', credentials=AnonymousCredentials())
+        self.fail_at = fail_at
+        self.committed = []
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+def make_db(client):
+    db = FirestoreDB.__new__(FirestoreDB)
+    db.db = client
+    db.cache = ReadCache()
+    db.mirror = Mirror('test')
+    db.replica = None
+    return db
+
+
+def test_write_batch_keeps_deletes_with_their_tombstones(monkeypatch):
+    monkeypatch.setattr(firestore_module, 'BATCH_LIMIT', 4)
+    client = FakeClient()
+    operations = [('set', 'records', 'a', {}), ('delete', 'records', 'b', None),
+                  ('delete', 'records', 'c', None), ('set', 'records', 'd', {})]
+    assert make_db(client).write_batch(operations) == 2
+    assert client.committed == [3, 3]
+
+
+def test_write_batch_reports_the_operations_committed_before_a_failure(monkeypatch):
+    monkeypatch.setattr(firestore_module, 'BATCH_LIMIT', 2)
+    operations = [('set', 'records', str(i), {}) for i in range(5)]
+    with pytest.raises(BatchWriteError) as error:
+        make_db(FakeClient(fail_at=1)).write_batch(operations)
+    assert error.value.committed == 2
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from backend.fleet_cube import FleetCube, to_epoch_days
+
+READINGS = pd.DataFrame({
+    'machine_id': ['a', 'a', 'a', 'a', 'b', 'b'],
+    'date': ['2024-01-01 10:00:00', '2024-01-02 09:00:00', '2024-01-02 18:00:00', '2024-01-03 10:00:00',
+             '2024-01-01 00:00:00', '2024-01-03 00:00:00'],
+    'coins_in': [100, 150, 180, 200, 10, 30],
+    'toys_payout': [1, 2, 3, 4, 0, 1],
+})
+
+
+def test_same_day_readings_add_up():
+    cube = FleetCube.from_records(READINGS.iloc[[0, 1, 4]])
+    cube.append(READINGS.iloc[[2, 3, 5]])
+    assert cube.coins_in.tolist() == [[80, 20], [0, 20]]
+    assert np.array_equal(cube.coins_in, FleetCube.from_records(READINGS).coins_in)
+
+
+def test_rewrite_picks_up_corrections():
+    corrected = READINGS.copy()
+    corrected.loc[2, 'coins_in'] = 170
+    cube = FleetCube.from_records(READINGS)
+    from_day = int(to_epoch_days(['2024-01-02'])[0])
+    assert cube.rewrite({'a': from_day}, corrected.iloc[[1, 2, 3]], corrected.iloc[[0]])
+    assert np.array_equal(cube.coins_in, FleetCube.from_records(corrected).coins_in)
+    assert not cube.rewrite({'a': from_day}, corrected.iloc[[1, 2, 3]], corrected.iloc[[0]])
+
+
+def test_npz_round_trip_keeps_updated_mark():
+    cube = FleetCube.from_records(READINGS)
+    cube.updated_mark = 1700000000.5
+    loaded = FleetCube.from_npz_bytes(cube.to_npz_bytes())
+    assert loaded.updated_mark == cube.updated_mark
+    assert np.array_equal(loaded.coins_in, cube.coins_in)